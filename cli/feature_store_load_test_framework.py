@@ -174,21 +174,22 @@ def main(argv):
       raise Exception(
           f'Failed to execute FeatureStore load testing framework.') from ex
   else:
+    # Gradle splits the value of --args into the worker's arguments
+    worker_args = [
+        f'--target_qps={FLAGS.target_qps}',
+        f'--num_threads={FLAGS.num_threads}',
+        f'--sample_strategy={FLAGS.sample_strategy}',
+        f'--num_warmup_samples={FLAGS.num_warmup_samples}',
+        f'--num_samples={FLAGS.num_samples}',
+        f'--project_id={FLAGS.project_id}',
+        f'--region={FLAGS.region}',
+        f'--gcs_output_path={FLAGS.gcs_log_path}',
+        f'--feature_query_file={FLAGS.feature_query_file_path}',
+        f'--entity_file={FLAGS.entity_file_path}',
+        f'--bigquery_output_dataset={FLAGS.existing_biqquery_dataset_id}',
+    ]
     subprocess.run(
-        [
-            './gradlew', 'run', f'--args='
-            f'--target_qps={str(FLAGS.target_qps)} '
-            f'--num_threads={str(FLAGS.num_threads)} '
-            f'--sample_strategy={FLAGS.sample_strategy} '
-            f'--num_warmup_samples={FLAGS.num_warmup_samples} '
-            f'--num_samples={str(FLAGS.num_samples)} '
-            f'--project_id={FLAGS.project_id} '
-            f'--region={FLAGS.region} '
-            f'--gcs_output_path={FLAGS.gcs_log_path} '
-            f'--feature_query_file={FLAGS.feature_query_file_path} '
-            f'--entity_file={FLAGS.entity_file_path} '
-            f'--bigquery_output_dataset={FLAGS.existing_biqquery_dataset_id} '
-        ],
+        ['./gradlew', 'run', f"--args={' '.join(worker_args)}"],
         cwd='../worker',
         check=True,
     )
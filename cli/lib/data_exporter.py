@@ -12,26 +12,75 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from collections import defaultdict
+from concurrent.futures import as_completed
+from concurrent.futures import Future
+from concurrent.futures import ThreadPoolExecutor
 import csv
-from io import StringIO
+from dataclasses import dataclass
+import functools
+from io import BytesIO
+from io import TextIOWrapper
+from operator import itemgetter
 from os import path
 import re
-from uuid import uuid4
+from secrets import token_hex
+from typing import TextIO
 
 from absl import logging
+from google.api_core import operation
 from google.cloud import storage
 from google.cloud.aiplatform_v1 import FeaturestoreServiceClient
+from google.cloud.aiplatform_v1.services.featurestore_service.transports import FeaturestoreServiceGrpcTransport
 from google.cloud.aiplatform_v1.types import entity_type as entity_type_pb2
 from google.cloud.aiplatform_v1.types import FeatureSelector, IdMatcher
 from google.cloud.aiplatform_v1.types import featurestore as featurestore_pb2
 from google.cloud.aiplatform_v1.types import featurestore_service as featurestore_service_pb2
 from google.cloud.aiplatform_v1.types import io as io_pb2
+from google.protobuf import field_mask_pb2
 from lib.featurestore_data_classes import EntityType
+from lib.featurestore_data_classes import FeatureMetadata
 from lib.featurestore_data_classes import Featurestore
-
-GS_ORIGINAL_PATH_FORMAT = '^gs://(?P<bucket_name>[^/]+)/?(?P<blob_name>.*)$'
-GS_FINAL_PATH_FORMAT = '^gs://(?P<bucket_name>[^/]+)/(?P<blob_name>.+)$'
+from lib.gcs_utils import split_gcs_path
+
+# Characters that make csv.writer quote a field when the delimiter is '/'
+CSV_QUOTED_CHARACTERS_PATTERN = re.compile('[/"\r\n]')
+MAX_EXPORT_WORKERS = 16
+MAX_CONCURRENT_EXPORTS = 32
+MAX_DELETE_WORKERS = 4
+# GCS accepts up to 100 calls per batch request
+DELETE_BATCH_SIZE = 100
+MAX_DOWNLOAD_WORKERS = 16
+# Number of FeatureStore clients export workers are spread over, each with its
+# own connection, so concurrent exports aren't capped by the stream limit of a
+# single HTTP/2 connection
+FEATURESTORE_CHANNEL_POOL_SIZE = 4
+WRITE_BATCH_SIZE = 10000  # rows
+WRITE_BUFFER_SIZE = 1 << 20  # 1 MiB
+# Size of each ranged read of an export; exports are read concurrently, so
+# this bounds the download buffers held at once
+DOWNLOAD_CHUNK_SIZE = 8 * 1024 * 1024  # 8 MiB
+# Shared metadata for exported features that weren't listed for their entity
+# type; never modified
+UNLISTED_FEATURE_METADATA = FeatureMetadata()
+# Only these fields of the listed resources are used, so don't transfer the
+# rest (e.g. labels, serving configs, monitoring configs)
+NAME_READ_MASK = field_mask_pb2.FieldMask(paths=['name'])
+FEATURE_READ_MASK = field_mask_pb2.FieldMask(paths=['name', 'value_type'])
+# Documented maximum page sizes of the list RPCs. They currently equal the
+# defaults; they're pinned so fewer pages are fetched if the defaults change.
+FEATURESTORE_PAGE_SIZE = 100
+ENTITY_TYPE_PAGE_SIZE = 1000
+FEATURE_PAGE_SIZE = 1000
+
+
+@dataclass(frozen=True, slots=True)
+class _ExportWorkers:
+  """Executors shared by the exports of one execute() call."""
+  entity_type_executor: ThreadPoolExecutor
+  download_executor: ThreadPoolExecutor
+  delete_executor: ThreadPoolExecutor
+  # Futures of the temporary folders' deletion
+  pending_deletes: list[Future]
 
 
 class DataExporter:
@@ -53,91 +102,162 @@ class DataExporter:
             regex.
           entity_type_regex: Export only EntityTypes that match this regex.
     """
-    if not re.match(GS_ORIGINAL_PATH_FORMAT, gcs_path):
-      raise ValueError(f'Not a valid GS path format: {gcs_path}')
+    bucket_name, self._gcs_blob_prefix = split_gcs_path(gcs_path)
     self._project_id = project_id
     self._region = region
     self._export_file_path = export_file_path
     self._gcs_path = gcs_path
-    self._featurestore_id_regex = featurestore_id_regex
-    self._entity_type_id_regex = entity_type_id_regex
+    # The list RPCs can only filter on times, labels and value types, not on
+    # IDs, so listed resources are matched against these instead
+    self._featurestore_id_pattern = re.compile(featurestore_id_regex)
+    self._entity_type_id_pattern = re.compile(entity_type_id_regex)
     self._api_endpoint = f'{region}-aiplatform.googleapis.com'
+    self._location_path = FeaturestoreServiceClient.common_location_path(
+        project_id, region)
+    # The clients are thread-safe, so every export worker shares them
+    self._featurestore_clients = _get_featurestore_clients(self._api_endpoint)
+    self._gcs_client = _get_storage_client(self._project_id)
+    self._gcs_bucket = self._gcs_client.bucket(bucket_name)
+    # Every entity type is exported in full, so build these parts of the
+    # export request once
+    self._full_export = (
+        featurestore_service_pb2.ExportFeatureValuesRequest.FullExport())
+    self._feature_selector = FeatureSelector(id_matcher=IdMatcher(ids=['*']))
 
   def execute(self):
     'Execute the data exporter.'
-    featurestores = self._export_featurestores()
+    # Temporary blobs are deleted off the export path; leaving the executor
+    # waits for any deletes still in flight
+    with ThreadPoolExecutor(max_workers=MAX_DELETE_WORKERS) as delete_executor:
+      pending_deletes = []
+      featurestores = self._export_featurestores(delete_executor,
+                                                 pending_deletes)
+    for future in pending_deletes:
+      future.result()
     self._write_to_file(featurestores)
 
-  def _export_featurestores(self) -> list[Featurestore]:
+  def _export_featurestores(
+      self, delete_executor: ThreadPoolExecutor,
+      pending_deletes: list[Future]) -> list[Featurestore]:
     """Export featurestores.
 
+        Args:
+            delete_executor: Executor to delete the temporary folders with.
+            pending_deletes: List to add the futures of the deletes to.
+
         Returns:
             Featurestore data for all the Featurestores and entity types
                 that match the regexes.
     """
-    featurestore_client = FeaturestoreServiceClient(
-        client_options={'api_endpoint': self._api_endpoint})
-    common_location_path = featurestore_client.common_location_path(
-        self._project_id, self._region)
-
+    featurestore_client = self._featurestore_clients[0]
     featurestore_objects = featurestore_client.list_featurestores(
-        parent=common_location_path)
-    featurestores_data = defaultdict(Featurestore)
-
-    for featurestore_object in featurestore_objects:
-      featurestore_id = featurestore_object.name.split('/')[-1]
-      if not re.match(self._featurestore_id_regex, featurestore_id):
-        continue
-      self._export_featurestore_data(featurestore_client, featurestores_data,
-                                     featurestore_object, featurestore_id)
+        request={
+            'parent': self._location_path,
+            'page_size': FEATURESTORE_PAGE_SIZE,
+            'read_mask': NAME_READ_MASK
+        })
+    featurestores_data = {}
+
+    # The export is dominated by RPC latency, so overlap the featurestores.
+    # Each dict of local data has a single writer: featurestores are added
+    # here, each featurestore's entity types by its own task and each entity
+    # type's data by its own worker. The entity types of every featurestore
+    # share one pool, which bounds the number of exports running at once.
+    with ThreadPoolExecutor(
+        max_workers=MAX_CONCURRENT_EXPORTS) as entity_type_executor, \
+        ThreadPoolExecutor(
+            max_workers=MAX_DOWNLOAD_WORKERS) as download_executor:
+      workers = _ExportWorkers(entity_type_executor, download_executor,
+                               delete_executor, pending_deletes)
+      with ThreadPoolExecutor(max_workers=MAX_EXPORT_WORKERS) as executor:
+        futures = []
+        for featurestore_object in featurestore_objects:
+          featurestore_id = featurestore_object.name.rpartition('/')[2]
+          if not self._featurestore_id_pattern.match(featurestore_id):
+            continue
+          featurestore_data = featurestores_data[featurestore_id] = (
+              Featurestore())
+          futures.append(
+              executor.submit(self._export_featurestore_data, workers,
+                              featurestore_client, featurestore_data,
+                              featurestore_object, featurestore_id))
+        entity_type_futures = [
+            entity_type_future for future in futures
+            for entity_type_future in future.result()
+        ]
+      # Surface the first failure, dropping the exports that haven't started;
+      # the ones already running are still waited on when the executors close
+      try:
+        for future in as_completed(entity_type_futures):
+          future.result()
+      except Exception:
+        entity_type_executor.shutdown(wait=False, cancel_futures=True)
+        download_executor.shutdown(wait=False, cancel_futures=True)
+        raise
 
     return featurestores_data
 
-  def _export_featurestore_data(self,
+  def _export_featurestore_data(self, workers: _ExportWorkers,
                                 featurestore_client: FeaturestoreServiceClient,
-                                featurestores_data: list[Featurestore],
+                                featurestore_data: Featurestore,
                                 featurestore_object: featurestore_pb2,
-                                featurestore_id: str):
-    """Export the data from a Featurestore.
+                                featurestore_id: str) -> list[Future]:
+    """Start exporting the data from a Featurestore.
 
         Args:
+            workers: Executors and pending deletes of this export.
             featurestore_client: FeatureStore service client for FS instance to
               export from.
-            featurestores_data: Local Featurestores data.
+            featurestore_data: Local Featurestore data.
             featurestore_object: Remote Featurestore object.
             featurestore_id: ID of the Featurestore.
+
+        Returns:
+            Futures of the exports of the Featurestore's entity types.
     """
     logging.info(f"Opening Featurestore '{featurestore_id}'...")
-    featurestore_data = featurestores_data[featurestore_id]
+    futures = []
     for entity_type in featurestore_client.list_entity_types(
-        parent=featurestore_object.name):
-      entity_type_id = entity_type.name.split('/')[-1]
-      if not re.match(self._entity_type_id_regex, entity_type_id):
+        request={
+            'parent': featurestore_object.name,
+            'page_size': ENTITY_TYPE_PAGE_SIZE,
+            'read_mask': NAME_READ_MASK
+        }):
+      entity_type_id = entity_type.name.rpartition('/')[2]
+      if not self._entity_type_id_pattern.match(entity_type_id):
         continue
-      self._export_entity_type_data(featurestore_client, entity_type_id,
-                                    featurestore_data, entity_type)
-
-  def _export_entity_type_data(self,
+      entity_type_data = EntityType()
+      featurestore_data.entity_types[entity_type_id] = entity_type_data
+      # Spread the entity types over the pooled clients' connections
+      entity_type_client = self._featurestore_clients[
+          len(futures) % len(self._featurestore_clients)]
+      futures.append(
+          workers.entity_type_executor.submit(self._export_entity_type_data,
+                                              workers, entity_type_client,
+                                              entity_type_id, entity_type_data,
+                                              entity_type))
+    return futures
+
+  def _export_entity_type_data(self, workers: _ExportWorkers,
                                featurestore_client: FeaturestoreServiceClient,
                                entity_type_id: str,
-                               featurestore_data: Featurestore,
+                               entity_type_data: EntityType,
                                entity_type_object: entity_type_pb2):
     """Export the data for an entity type.
 
         Args:
+            workers: Executors and pending deletes of this export.
             featurestore_client: FeatureStore service client for FS instance to
               export from.
             entity_type_id: ID of the entity type.
-            featurestore_data: Local Featurestore data.
+            entity_type_data: Local entity type data.
             entity_type_object: Remote entity type object.
     """
     logging.info(f"Opening entity type '{entity_type_id}'...")
-    entity_type_data = featurestore_data.entity_types[entity_type_id]
 
-    self._export_feature_metadata(featurestore_client, entity_type_id,
-                                  entity_type_data, entity_type_object)
-    self._export_entity_type_entity_data(featurestore_client, entity_type_id,
-                                         entity_type_data, entity_type_object)
+    self._export_entity_type_entity_data(workers, featurestore_client,
+                                         entity_type_id, entity_type_data,
+                                         entity_type_object)
 
   def _export_feature_metadata(self,
                                featurestore_client: FeaturestoreServiceClient,
@@ -156,17 +276,23 @@ class DataExporter:
     logging.info(
         f"Exporting feature metadata for entity type '{entity_type_id}'...")
     for feature in featurestore_client.list_features(
-        parent=entity_type_object.name):
-      feature_id = feature.name.split('/')[-1]
-      entity_type_data.features_metadata[
-          feature_id].data_type = feature.value_type
+        request={
+            'parent': entity_type_object.name,
+            'page_size': FEATURE_PAGE_SIZE,
+            'read_mask': FEATURE_READ_MASK
+        }):
+      feature_id = feature.name.rpartition('/')[2]
+      entity_type_data.features_metadata[feature_id] = FeatureMetadata(
+          data_type=feature.value_type)
 
   def _export_entity_type_entity_data(
-      self, featurestore_client: FeaturestoreServiceClient, entity_type_id: str,
+      self, workers: _ExportWorkers,
+      featurestore_client: FeaturestoreServiceClient, entity_type_id: str,
       entity_type_data: EntityType, entity_type_object: entity_type_pb2):
-    """Export the entity data for an entity type.
+    """Export the entity data and feature metadata for an entity type.
 
         Args:
+            workers: Executors and pending deletes of this export.
             featurestore_client: FeatureStore service client for FS instance to
               export from.
             entity_type_id: ID of the entity type.
@@ -175,16 +301,28 @@ class DataExporter:
     """
     logging.info(
         f"Exporting entity data from entity type '{entity_type_id}'...")
-    unique_folder_path, blob = self._locate_folder_and_blob(entity_type_id)
+    unique_folder_path, blob_prefix = self._locate_folder(entity_type_id)
     try:
-      with StringIO(newline='') as csv_file:
-        self._export_entity_and_features(featurestore_client,
-                                         entity_type_object, unique_folder_path,
-                                         blob, csv_file)
-        self._process_entities_and_features(entity_type_id, entity_type_data,
-                                            csv_file)
+      export_operation = self._export_entity_and_features(
+          featurestore_client, entity_type_object, unique_folder_path)
+      # The export runs for a while, so list the feature metadata meanwhile
+      self._export_feature_metadata(featurestore_client, entity_type_id,
+                                    entity_type_data, entity_type_object)
+      export_operation.result()
+      # Large exports are split over several files; they're listed in order
+      blobs = list(self._gcs_bucket.list_blobs(prefix=blob_prefix))
+      if len(blobs) == 1:
+        shards = [self._read_export_shard(entity_type_id, blobs[0])]
+      else:
+        shards = list(
+            workers.download_executor.map(
+                functools.partial(self._read_export_shard, entity_type_id),
+                blobs))
+      self._process_entities_and_features(entity_type_id, entity_type_data,
+                                          shards)
     finally:
-      blob.delete()
+      workers.pending_deletes.append(
+          workers.delete_executor.submit(self._delete_folder, blob_prefix))
 
   def _write_to_file(self, featurestores_data: list[Featurestore]):
     """Write data for Featurestore(s) to the export file.
@@ -193,117 +331,237 @@ class DataExporter:
             featurestores_data: Data from Featurestore(s).
     """
     logging.info(f"Writing file '{self._export_file_path}'...")
-    with open(self._export_file_path, 'w', newline='') as file:
-      data_writer = csv.writer(file, delimiter='/')
+    # The lines are built directly rather than through csv.writer; only IDs
+    # and values can contain characters that need quoting. Each batch is
+    # encoded in one go and written to a binary file, skipping the per-line
+    # encoding of a text file.
+    with open(self._export_file_path, 'wb',
+              buffering=WRITE_BUFFER_SIZE) as file:
+      lines = []
       for featurestore_id, featurestore in featurestores_data.items():
         for entity_type_id, entity_type in featurestore.entity_types.items():
-          for entity_id, entity in entity_type.entities.items():
-            for feature_id, feature in entity.features.items():
-              line_data = [
-                  'featurestores', featurestore_id, 'entityTypes',
-                  entity_type_id, 'entities', entity_id, 'features', feature_id,
-                  'featureDataTypes',
-                  entity_type.features_metadata[feature_id].data_type.name,
-                  'featureValues', feature.value
-              ]
-              data_writer.writerow(line_data)
-
-  def _locate_folder_and_blob(self,
-                              entity_type_id: str) -> tuple[str, storage.Blob]:
-    """Locate the folder to write export data in and the corresponding blob object.
+          entity_type_prefix = (f'featurestores/{featurestore_id}/'
+                                f'entityTypes/{entity_type_id}/entities/')
+          columns = []
+          for feature_id, column in entity_type.columns.items():
+            data_type = entity_type.features_metadata.get(
+                feature_id, UNLISTED_FEATURE_METADATA).data_type
+            columns.append((f'/features/{feature_id}/featureDataTypes/'
+                            f'{data_type.name}/featureValues/',
+                            _quote_column(column)))
+          for row, entity_id in enumerate(
+              _quote_column(entity_type.entity_ids)):
+            entity_prefix = entity_type_prefix + entity_id
+            for feature_infix, column in columns:
+              lines.append(f'{entity_prefix}{feature_infix}{column[row]}\r\n')
+              if len(lines) >= WRITE_BATCH_SIZE:
+                file.write(''.join(lines).encode('utf-8'))
+                lines = []
+      if lines:
+        file.write(''.join(lines).encode('utf-8'))
+
+  def _locate_folder(self, entity_type_id: str) -> tuple[str, str]:
+    """Locate the folder to write export data in.
 
         Args:
-            entity_type_id: Entitiy type ID for the data in the export file.
+            entity_type_id: Entitiy type ID for the data in the export files.
 
         Returns:
             Unique folder path for the entity type data.
-            Blob object for the data file.
+            Prefix of the names of the blobs in the folder.
     """
     # Create a unique file path for each entity type
-    unique_folder = f'{entity_type_id}_{str(uuid4())[:5]}'
+    unique_folder = f'{entity_type_id}_{token_hex(3)}'
     unique_folder_path = path.join(self._gcs_path, unique_folder)
-    filepath = path.join(
-        unique_folder_path,
-        '000000000000.csv')  # 12 zeroes, the FS client always uses this name
+    blob_prefix = path.join(self._gcs_blob_prefix, unique_folder, '')
+
+    return unique_folder_path, blob_prefix
 
-    # Locate the blob object (nothing is uploaded yet)
-    match = re.match(GS_FINAL_PATH_FORMAT, filepath)
-    gcs_client = storage.Client(self._project_id)
-    bucket = gcs_client.bucket(match.group('bucket_name'))
-    blob = bucket.blob(match.group('blob_name'))
+  def _delete_folder(self, blob_prefix: str):
+    """Delete the blobs in a folder.
 
-    return unique_folder_path, blob
+        Args:
+            blob_prefix: Prefix of the names of the blobs in the folder.
+    """
+    blobs = list(self._gcs_bucket.list_blobs(prefix=blob_prefix))
+    # Coalesce the deletes into as few HTTP requests as possible
+    for start in range(0, len(blobs), DELETE_BATCH_SIZE):
+      with self._gcs_client.batch():
+        for blob in blobs[start:start + DELETE_BATCH_SIZE]:
+          blob.delete()
 
   def _export_entity_and_features(
       self, featurestore_client: FeaturestoreServiceClient,
-      entity_type_object: entity_type_pb2, unique_folder_path: str,
-      blob: storage.Blob, csv_file: StringIO):
-    """Export entity and feature data values for entity type.
+      entity_type_object: entity_type_pb2,
+      unique_folder_path: str) -> operation.Operation:
+    """Start exporting entity and feature data values for entity type.
 
         Args:
             featurestore_client: FeatureStore service client for FS instance to
               export from.
             entity_type_object: Remote entity type object.
             unique_folder_path: Unique folder path for the entity type data.
-            blob: Blob object for the data file.
-            csv_file: String buffer representing the data in CSV format.
+
+        Returns:
+            Long-running operation of the export.
     """
     export_request = featurestore_service_pb2.ExportFeatureValuesRequest(
-        full_export=featurestore_service_pb2.ExportFeatureValuesRequest
-        .FullExport(),
+        full_export=self._full_export,
         entity_type=entity_type_object.name,
-        feature_selector=FeatureSelector(id_matcher=IdMatcher(ids=['*'])),
+        feature_selector=self._feature_selector,
         destination=featurestore_service_pb2.FeatureValueDestination(
             csv_destination=io_pb2.CsvDestination(
                 gcs_destination=io_pb2.GcsDestination(
                     output_uri_prefix=unique_folder_path))))
-    featurestore_client.export_feature_values(request=export_request).result()
-    entity_type_data_export = blob.download_as_bytes().decode('utf-8')
-    csv_file.write(entity_type_data_export)
-    csv_file.seek(0)
-
-  def _process_entities_and_features(self, entity_type_id: str,
-                                     entity_type_data: EntityType,
-                                     csv_file: StringIO):
-    """Process entity and feature data for an entity type.
+    return featurestore_client.export_feature_values(request=export_request)
+
+  def _read_export_shard(
+      self, entity_type_id: str,
+      blob: storage.Blob) -> tuple[list[str], dict[str, list[str]]]:
+    """Read one file of the exported CSV data for an entity type.
 
         Args:
             entity_type_id: ID of the entity type.
-            entity_type_data: Local entity type data.
-            csv_file: String buffer representing the data in CSV format.
-    """
-    first_line = True
-    features_in_order = list()
-
-    csv_reader = csv.reader(csv_file)
-    for row in csv_reader:
-      if first_line:
-        # Header line
-        first_line = False
-        features_in_order = row
-      else:
-        self._process_data_line(entity_type_id, entity_type_data,
-                                features_in_order, row)
+            blob: Blob object for the file.
 
-  def _process_data_line(self, entity_type_id: str, entity_type_data: str,
-                         features_in_order: list[str],
-                         feature_values: list[str]):
-    """Process one row of data belonging to one entity.
+        Returns:
+            Header line of the file (empty if the file is).
+            Last line for each entity in the file, by entity ID.
+    """
+    with _open_export_file(blob) as csv_file:
+      rows = iter(csv.reader(csv_file))
+      features_in_order = next(rows, None)  # Header line
+      if features_in_order is None:
+        return [], {}
+
+      entity_column_name = f'entity_type_{entity_type_id}'
+      if entity_column_name not in features_in_order:
+        logging.warning('No entity ID column in export header: %s',
+                        features_in_order)
+        return features_in_order, {}
+      entity_column = features_in_order.index(entity_column_name)
+
+      # An entity can appear on several lines of a full export and the last
+      # one wins. Keeping whole lines per entity leaves the per-value work to
+      # C-level builtins instead of a Python loop over every cell. Lines
+      # without an entity ID (e.g. blank ones) are skipped, and lines cut
+      # short are padded with blank values.
+      header_length = len(features_in_order)
+      return features_in_order, {
+          line[entity_column]: line if len(line) >= header_length else
+          line + [''] * (header_length - len(line))
+          for line in rows
+          if len(line) > entity_column
+      }
+
+  def _process_entities_and_features(
+      self, entity_type_id: str, entity_type_data: EntityType,
+      shards: list[tuple[list[str], dict[str, list[str]]]]):
+    """Process entity and feature data for an entity type.
 
         Args:
             entity_type_id: ID of the entity type.
             entity_type_data: Local entity type data.
-            features_in_order: List of the features, in the order they are in
-              the line.
-            fature_values: List of feature values for one entity.
+            shards: Header and latest lines of each exported file, in order.
+
+        Raises:
+            ValueError if the exported files have different headers.
     """
-    entity_id = ''
-    for feature_name, feature_value in zip(features_in_order, feature_values):
-      if feature_name == f'entity_type_{entity_type_id}':
-        entity_id = feature_value
-      elif feature_name == 'feature_timestamp':
-        # TODO: Support exporting feature timestamp?
+    features_in_order = None
+    latest_lines = {}
+    for shard_features_in_order, shard_lines in shards:
+      if not shard_lines:
         continue
-      else:
-        entity_type_data.entities[entity_id].features[
-            feature_name].value = feature_value
+      if features_in_order is None:
+        features_in_order = shard_features_in_order
+      elif shard_features_in_order != features_in_order:
+        raise ValueError(
+            f"Export files of entity type '{entity_type_id}' have different "
+            f'headers: {features_in_order}, {shard_features_in_order}')
+      latest_lines.update(shard_lines)
+    if features_in_order is None:
+      return
+
+    entity_column = features_in_order.index(f'entity_type_{entity_type_id}')
+    lines = latest_lines.values()
+    entity_type_data.entity_ids.extend(latest_lines)
+    for i, feature_name in enumerate(features_in_order):
+      # TODO: Support exporting feature timestamp?
+      if i != entity_column and feature_name != 'feature_timestamp':
+        entity_type_data.columns[feature_name] = list(
+            map(itemgetter(i), lines))
+
+
+def _open_export_file(blob: storage.Blob) -> TextIO:
+  """Open an exported CSV file for reading.
+
+    Args:
+        blob: Blob object for the file, as listed.
+
+    Returns:
+        Text file of the blob's content.
+  """
+  # A streamed read only learns it's at the end of the blob from a request
+  # past it, so a file that fits in one chunk is downloaded in one request.
+  # It's still decoded as it's parsed rather than all at once.
+  if blob.size is not None and blob.size <= DOWNLOAD_CHUNK_SIZE:
+    return TextIOWrapper(
+        BytesIO(blob.download_as_bytes()), encoding='utf-8', newline='')
+  # Stream the export rather than holding the whole file in memory
+  return blob.open('r', chunk_size=DOWNLOAD_CHUNK_SIZE, encoding='utf-8',
+                   newline='')
+
+
+def _quote_field(field: str) -> str:
+  """Quote a field the way csv.writer does for the '/' delimited data file."""
+  if CSV_QUOTED_CHARACTERS_PATTERN.search(field):
+    return '"' + field.replace('"', '""') + '"'
+  return field
+
+
+def _quote_column(column: list[str]) -> list[str]:
+  """Quote the fields of a column the way csv.writer does.
+
+    Fields rarely need quoting, so a single search over the whole column
+    usually avoids quoting field by field.
+  """
+  if CSV_QUOTED_CHARACTERS_PATTERN.search(''.join(column)):
+    return list(map(_quote_field, column))
+  return column
+
+
+def _create_featurestore_channel(*args, options=(), **kwargs):
+  """Create a gRPC channel that doesn't share its connection.
+
+    Identical channels otherwise share a subchannel, and so a single HTTP/2
+    connection, through gRPC's global subchannel pool.
+  """
+  return FeaturestoreServiceGrpcTransport.create_channel(
+      *args,
+      options=[*options, ('grpc.use_local_subchannel_pool', 1)],
+      **kwargs)
+
+
+@functools.lru_cache(maxsize=8)
+def _get_featurestore_clients(
+    api_endpoint: str) -> tuple[FeaturestoreServiceClient, ...]:
+  """Get a pool of FeatureStore service clients, reusing one already connected.
+
+    Args:
+        api_endpoint: FeatureStore API endpoint to connect to.
+
+    Returns:
+        FEATURESTORE_CHANNEL_POOL_SIZE clients, each with its own connection.
+  """
+  transport = functools.partial(
+      FeaturestoreServiceGrpcTransport, channel=_create_featurestore_channel)
+  return tuple(
+      FeaturestoreServiceClient(
+          client_options={'api_endpoint': api_endpoint}, transport=transport)
+      for _ in range(FEATURESTORE_CHANNEL_POOL_SIZE))
+
+
+@functools.lru_cache(maxsize=8)
+def _get_storage_client(project_id: str) -> storage.Client:
+  """Get a GCS client, reusing one already connected."""
+  return storage.Client(project_id)
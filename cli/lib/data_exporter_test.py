@@ -21,6 +21,9 @@ from google.cloud.aiplatform_v1.types import entity_type as entity_type_pb2
 from google.cloud.aiplatform_v1.types import featurestore as featurestore_pb2
 
 import lib.data_exporter as data_exporter
+from lib.featurestore_data_classes import EntityType
+from lib.featurestore_data_classes import FeatureMetadata
+from lib.featurestore_data_classes import Featurestore
 
 
 class DataExporterTest(absltest.TestCase):
@@ -28,13 +31,23 @@ class DataExporterTest(absltest.TestCase):
     def setUp(self):
         super().setUp()
 
-        self.entity_type_pb2_mock = self.enter_context(
-            absltest.mock.patch.object(data_exporter, 'entity_type_pb2', autospec=True))
+        # Clients are cached across exporters, so start each test afresh
+        data_exporter._get_featurestore_clients.cache_clear()
+        data_exporter._get_storage_client.cache_clear()
+
+        # Patch all the exporter's dependencies at once
+        mocks = self.enter_context(absltest.mock.patch.multiple(
+            data_exporter, autospec=True, **dict.fromkeys([
+                'entity_type_pb2', 'featurestore_pb2', 'featurestore_service_pb2',
+                'io_pb2', 'FeatureSelector', 'IdMatcher', 'token_hex',
+                'FeaturestoreServiceClient', 'storage', 'csv', 'logging'],
+                absltest.mock.DEFAULT)))
+
+        self.entity_type_pb2_mock = mocks['entity_type_pb2']
         self.entity_type_mock = self.entity_type_pb2_mock.return_value
         self.entity_type_mock.name = 'projects/project-number/locations/region/featurestores/featurestore-id/entityTypes/entity-type-id'
 
-        self.featurestore_pb2_mock = self.enter_context(
-            absltest.mock.patch.object(data_exporter, 'featurestore_pb2', autospec=True))
+        self.featurestore_pb2_mock = mocks['featurestore_pb2']
         self.featurestore_mock = self.featurestore_pb2_mock.return_value
         self.featurestore_mock.name = 'projects/project-number/locations/region/featurestores/featurestore-id'
 
@@ -42,111 +55,134 @@ class DataExporterTest(absltest.TestCase):
         self.feature_mock.name = 'projects/project-number/locations/region/featurestores/featurestore-id/entityTypes/entity-type-id/features/feature-id'
         self.feature_mock.value_type.name = 'STRING'
 
-        self.featurestore_service_pb2_mock = self.enter_context(
-            absltest.mock.patch.object(data_exporter, 'featurestore_service_pb2', autospec=True))
+        self.featurestore_service_pb2_mock = mocks['featurestore_service_pb2']
         self.export_feature_values_request_mock = self.featurestore_service_pb2_mock.ExportFeatureValuesRequest
         self.full_export = self.featurestore_service_pb2_mock.ExportFeatureValuesRequest.FullExport
         self.feature_value_destination_mock = self.featurestore_service_pb2_mock.FeatureValueDestination
 
-        self.io_pb2_mock = self.enter_context(
-            absltest.mock.patch.object(data_exporter, 'io_pb2', autospec=True))
+        self.io_pb2_mock = mocks['io_pb2']
 
-        self.feature_selector_mock = self.enter_context(
-            absltest.mock.patch.object(data_exporter, 'FeatureSelector', autospec=True))
-        self.id_matcher_mock = self.enter_context(
-            absltest.mock.patch.object(data_exporter, 'IdMatcher', autospec=True))
+        self.feature_selector_mock = mocks['FeatureSelector']
+        self.id_matcher_mock = mocks['IdMatcher']
 
-        uuid_mock = self.enter_context(
-            absltest.mock.patch.object(data_exporter, 'uuid4', autospec=True))
-        uuid_mock.return_value = 'd3d75afa-a029-4842-9b77-f753661dd1f5'
+        mocks['token_hex'].return_value = 'd3d75a'
 
-        self.fsclient_mock = self.enter_context(
-            absltest.mock.patch.object(data_exporter, 'FeaturestoreServiceClient', autospec=True))
+        self.fsclient_mock = mocks['FeaturestoreServiceClient']
         self.fsclient_mock.return_value.list_featurestores.return_value = [self.featurestore_mock]
         self.fsclient_mock.return_value.list_entity_types.return_value = [self.entity_type_mock]
         self.fsclient_mock.return_value.list_features.return_value = [self.feature_mock]
 
-        self.storage_mock = self.enter_context(
-            absltest.mock.patch.object(data_exporter, 'storage', autospec=True))
+        self.storage_mock = mocks['storage']
         self.storage_bucket_mock = self.storage_mock.Client.return_value.bucket
         self.storage_blob_mock = self.storage_mock.Client.return_value.bucket.return_value.blob
-        self.storage_blob_content_mock = self.storage_mock.Client.return_value.bucket.return_value.blob.return_value.download_as_bytes.return_value.decode
+        self.storage_blob_file_mock = self.storage_mock.Client.return_value.bucket.return_value.blob.return_value.open
+        self.storage_list_blobs_mock = self.storage_mock.Client.return_value.bucket.return_value.list_blobs
+        self.storage_list_blobs_mock.return_value = [self.storage_blob_mock.return_value]
+        # Big enough to be streamed
+        self.storage_blob_mock.return_value.size = data_exporter.DOWNLOAD_CHUNK_SIZE + 1
 
         # Open is a native method so it can't be autospec'ed
         self.open_mock = self.enter_context(
             absltest.mock.patch.object(data_exporter, 'open'))
 
-        self.csv_mock = self.enter_context(
-            absltest.mock.patch.object(data_exporter, 'csv', autospec=True))
+        self.csv_mock = mocks['csv']
         self.csv_mock.reader.return_value.__iter__.return_value = iter(
             [['feature_timestamp', 'entity_type_entity-type-id', 'feature-id'],
              ['2022-08-02 21:30:40.761 UTC', 'entity-id', 'feature-value']]
         )
 
-        self.stringio_mock = self.enter_context(
-            absltest.mock.patch.object(data_exporter, 'StringIO', autospec=True))
-
-        self.enter_context(
-            absltest.mock.patch.object(data_exporter, 'logging', autospec=True))
+    def _minimal_initialization(
+            self, gcs_path='gs://scratch-bucket/', featurestore_id_regex='.*',
+            entity_type_id_regex='.*') -> data_exporter.DataExporter:
+        return data_exporter.DataExporter(
+            'project-id', 'region', gcs_path, 'export.txt',
+            featurestore_id_regex, entity_type_id_regex)
+
+    def exported_data(self, entity_ids, values):
+        entity_type = EntityType(
+            entity_ids=entity_ids, columns={'feature-id': values})
+        entity_type.features_metadata['feature-id'] = FeatureMetadata(
+            data_type=self.feature_mock.value_type)
+        return {'featurestore-id': Featurestore(
+            entity_types={'entity-type-id': entity_type})}
 
     def test_create_featurestore_client(self):
-        tool = data_exporter.DataExporter('project-id', 'region',
-            'gs://scratch-bucket/', 'export.txt', '.*', '.*')
+        tool = self._minimal_initialization()
         tool.execute()
 
-        self.fsclient_mock.assert_called_with(client_options={"api_endpoint": "region-aiplatform.googleapis.com"})
+        self.assertEqual(self.fsclient_mock.call_count,
+                         data_exporter.FEATURESTORE_CHANNEL_POOL_SIZE)
+        _, kwargs = self.fsclient_mock.call_args
+        self.assertEqual(kwargs['client_options'],
+                         {"api_endpoint": "region-aiplatform.googleapis.com"})
+        self.assertIs(kwargs['transport'].func,
+                      data_exporter.FeaturestoreServiceGrpcTransport)
+        self.assertIs(kwargs['transport'].keywords['channel'],
+                      data_exporter._create_featurestore_channel)
+
+    def test_create_featurestore_channel(self):
+        transport_mock = self.enter_context(
+            absltest.mock.patch.object(data_exporter, 'FeaturestoreServiceGrpcTransport', autospec=True))
+
+        data_exporter._create_featurestore_channel(
+            'host', credentials=None,
+            options=[("grpc.max_send_message_length", -1)])
+
+        transport_mock.create_channel.assert_called_once_with(
+            'host', credentials=None,
+            options=[("grpc.max_send_message_length", -1),
+                     ("grpc.use_local_subchannel_pool", 1)])
 
     def test_list_featurestores(self):
-        tool = data_exporter.DataExporter('project-id', 'region',
-            'gs://scratch-bucket/', 'export.txt', '.*', '.*')
+        tool = self._minimal_initialization()
         tool.execute()
 
-        common_location_path_mock = self.fsclient_mock.return_value.common_location_path
+        common_location_path_mock = self.fsclient_mock.common_location_path
         common_location_path_mock.assert_called_with('project-id', 'region')
         self.fsclient_mock.return_value.list_featurestores.assert_called_with(
-            parent=common_location_path_mock.return_value)
+            request={'parent': common_location_path_mock.return_value,
+                     'page_size': data_exporter.FEATURESTORE_PAGE_SIZE,
+                     'read_mask': data_exporter.NAME_READ_MASK})
 
     def test_list_entity_types(self):
-        tool = data_exporter.DataExporter('project-id', 'region',
-            'gs://scratch-bucket/', 'export.txt', '.*', '.*')
+        tool = self._minimal_initialization()
         tool.execute()
 
         self.fsclient_mock.return_value.list_entity_types.assert_called_with(
-            parent=self.featurestore_mock.name)
+            request={'parent': self.featurestore_mock.name,
+                     'page_size': data_exporter.ENTITY_TYPE_PAGE_SIZE,
+                     'read_mask': data_exporter.NAME_READ_MASK})
 
     def test_list_features(self):
-        tool = data_exporter.DataExporter('project-id', 'region',
-            'gs://scratch-bucket/', 'export.txt', '.*', '.*')
+        tool = self._minimal_initialization()
         tool.execute()
 
         self.fsclient_mock.return_value.list_features.assert_called_with(
-            parent=self.entity_type_mock.name)
+            request={'parent': self.entity_type_mock.name,
+                     'page_size': data_exporter.FEATURE_PAGE_SIZE,
+                     'read_mask': data_exporter.FEATURE_READ_MASK})
 
     def test_create_storage_client(self):
-        tool = data_exporter.DataExporter('project-id', 'region',
-            'gs://scratch-bucket/', 'export.txt', '.*', '.*')
+        tool = self._minimal_initialization()
         tool.execute()
 
-        self.storage_mock.Client.assert_called_with('project-id')
+        self.storage_mock.Client.assert_called_once_with('project-id')
 
     def test_storage_get_bucket(self):
-        tool = data_exporter.DataExporter('project-id', 'region',
-            'gs://scratch-bucket/', 'export.txt', '.*', '.*')
+        tool = self._minimal_initialization()
         tool.execute()
 
         self.storage_bucket_mock.assert_called_with('scratch-bucket')
 
-    def test_storage_get_blob(self):
-        tool = data_exporter.DataExporter('project-id', 'region',
-            'gs://scratch-bucket/', 'export.txt', '.*', '.*')
+    def test_storage_list_blobs(self):
+        tool = self._minimal_initialization()
         tool.execute()
 
         self.storage_mock.assert_not_called()
-        self.storage_blob_mock.assert_called_with('entity-type-id_d3d75/000000000000.csv')
+        self.storage_list_blobs_mock.assert_called_with(prefix='entity-type-id_d3d75a/')
 
     def test_export_feature_values(self):
-        tool = data_exporter.DataExporter('project-id', 'region',
-            'gs://scratch-bucket/', 'export.txt', '.*', '.*')
+        tool = self._minimal_initialization()
         tool.execute()
 
         self.full_export.assert_called_with()
@@ -155,7 +191,7 @@ class DataExporterTest(absltest.TestCase):
             id_matcher = self.id_matcher_mock.return_value)
 
         self.io_pb2_mock.GcsDestination.assert_called_with(
-            output_uri_prefix='gs://scratch-bucket/entity-type-id_d3d75')
+            output_uri_prefix='gs://scratch-bucket/entity-type-id_d3d75a')
         self.io_pb2_mock.CsvDestination.assert_called_with(
             gcs_destination=self.io_pb2_mock.GcsDestination.return_value)
         self.feature_value_destination_mock.assert_called_with(
@@ -168,44 +204,237 @@ class DataExporterTest(absltest.TestCase):
             destination = self.feature_value_destination_mock.return_value
         )
 
+    def test_list_features_during_export(self):
+        tool = self._minimal_initialization()
+        tool.execute()
+
+        call_names = [
+            name for name, _, _ in self.fsclient_mock.return_value.mock_calls]
+        self.assertLess(call_names.index('export_feature_values'),
+                        call_names.index('list_features'))
+        self.assertLess(call_names.index('list_features'),
+                        call_names.index('export_feature_values().result'))
+
     def test_download_blob(self):
-        tool = data_exporter.DataExporter('project-id', 'region',
-            'gs://scratch-bucket/', 'export.txt', '.*', '.*')
+        tool = self._minimal_initialization()
+        tool.execute()
+
+        self.storage_blob_file_mock.assert_called_with(
+            'r', chunk_size=data_exporter.DOWNLOAD_CHUNK_SIZE, encoding='utf-8',
+            newline='')
+        self.storage_blob_file_mock.return_value.__exit__.assert_called()
+
+    def test_download_multiple_blobs(self):
+        blob_mock = absltest.mock.MagicMock(size=data_exporter.DOWNLOAD_CHUNK_SIZE + 1)
+        blob_mock_2 = absltest.mock.MagicMock(size=data_exporter.DOWNLOAD_CHUNK_SIZE + 1)
+        self.storage_list_blobs_mock.return_value = [blob_mock, blob_mock_2]
+        rows = {
+            blob_mock.open.return_value.__enter__.return_value: [
+                ['feature_timestamp', 'entity_type_entity-type-id', 'feature-id'],
+                ['2022-08-02 21:30:40.761 UTC', 'entity-id', 'old-value'],
+                ['2022-08-02 21:30:40.761 UTC', 'entity-id-2', 'feature-value-2']],
+            blob_mock_2.open.return_value.__enter__.return_value: [
+                ['feature_timestamp', 'entity_type_entity-type-id', 'feature-id'],
+                ['2022-08-03 21:30:40.761 UTC', 'entity-id', 'new-value']],
+        }
+        self.csv_mock.reader.side_effect = lambda csv_file: iter(rows[csv_file])
+
+        tool = self._minimal_initialization()
         tool.execute()
 
-        self.storage_blob_mock.return_value.download_as_bytes.assert_called_with()
-        self.storage_blob_content_mock.assert_called_with('utf-8')
-        self.stringio_mock.assert_called_with(newline='')
-        self.stringio_mock.return_value.__enter__().write.assert_called_with(self.storage_blob_content_mock.return_value)
-        self.stringio_mock.return_value.__enter__().seek.assert_called_with(0)
+        for mock in (blob_mock, blob_mock_2):
+            mock.open.assert_called_once_with(
+                'r', chunk_size=data_exporter.DOWNLOAD_CHUNK_SIZE,
+                encoding='utf-8', newline='')
+            mock.delete.assert_called_once_with()
+        self.open_mock.return_value.__enter__.return_value.write.assert_called_once_with(
+            b'featurestores/featurestore-id/entityTypes/entity-type-id/'
+            b'entities/entity-id/features/feature-id/featureDataTypes/STRING/'
+            b'featureValues/new-value\r\n'
+            b'featurestores/featurestore-id/entityTypes/entity-type-id/'
+            b'entities/entity-id-2/features/feature-id/featureDataTypes/STRING/'
+            b'featureValues/feature-value-2\r\n')
+
+    def test_download_blobs_different_headers(self):
+        blob_mock = absltest.mock.MagicMock(size=data_exporter.DOWNLOAD_CHUNK_SIZE + 1)
+        blob_mock_2 = absltest.mock.MagicMock(size=data_exporter.DOWNLOAD_CHUNK_SIZE + 1)
+        self.storage_list_blobs_mock.return_value = [blob_mock, blob_mock_2]
+        rows = {
+            blob_mock.open.return_value.__enter__.return_value: [
+                ['feature_timestamp', 'entity_type_entity-type-id', 'feature-id'],
+                ['2022-08-02 21:30:40.761 UTC', 'entity-id', 'feature-value']],
+            blob_mock_2.open.return_value.__enter__.return_value: [
+                ['entity_type_entity-type-id', 'feature-id'],
+                ['entity-id-2', 'feature-value-2']],
+        }
+        self.csv_mock.reader.side_effect = lambda csv_file: iter(rows[csv_file])
+
+        with self.assertRaises(ValueError):
+            tool = self._minimal_initialization()
+            tool.execute()
+
+        self.open_mock.assert_not_called()
+
+    def test_download_small_blob(self):
+        blob_mock = self.storage_blob_mock.return_value
+        blob_mock.size = data_exporter.DOWNLOAD_CHUNK_SIZE
+        blob_mock.download_as_bytes.return_value = b'entity_type_entity-type-id\r\n'
+        contents = []
+        self.csv_mock.reader.side_effect = lambda csv_file: iter(
+            contents.append(csv_file.read()) or [])
+
+        tool = self._minimal_initialization()
+        tool.execute()
+
+        blob_mock.download_as_bytes.assert_called_once_with()
+        blob_mock.open.assert_not_called()
+        self.assertEqual(contents, ['entity_type_entity-type-id\r\n'])
 
     def test_parse_download(self):
-        tool = data_exporter.DataExporter('project-id', 'region',
-            'gs://scratch-bucket/', 'export.txt', '.*', '.*')
+        tool = self._minimal_initialization()
         tool.execute()
 
-        self.csv_mock.reader.assert_called_with(self.stringio_mock.return_value.__enter__.return_value)
+        self.csv_mock.reader.assert_called_with(self.storage_blob_file_mock.return_value.__enter__.return_value)
         self.csv_mock.reader.return_value.__iter__.assert_called()
 
     def test_delete_blob(self):
-        tool = data_exporter.DataExporter('project-id', 'region',
-            'gs://scratch-bucket/', 'export.txt', '.*', '.*')
+        tool = self._minimal_initialization()
         tool.execute()
 
         self.storage_blob_mock.return_value.delete.assert_called_with()
 
+    def test_delete_blobs_in_batch(self):
+        blob_mock = absltest.mock.MagicMock(size=data_exporter.DOWNLOAD_CHUNK_SIZE + 1)
+        blob_mock_2 = absltest.mock.MagicMock(size=data_exporter.DOWNLOAD_CHUNK_SIZE + 1)
+        self.storage_list_blobs_mock.return_value = [blob_mock, blob_mock_2]
+        self.csv_mock.reader.return_value.__iter__.return_value = iter([])
+        calls = []
+        batch_mock = self.storage_mock.Client.return_value.batch.return_value
+        batch_mock.__enter__.side_effect = lambda: calls.append('enter')
+        batch_mock.__exit__.side_effect = lambda *args: calls.append('exit')
+        blob_mock.delete.side_effect = lambda: calls.append('delete')
+        blob_mock_2.delete.side_effect = lambda: calls.append('delete')
+
+        tool = self._minimal_initialization()
+        tool.execute()
+
+        self.assertEqual(calls, ['enter', 'delete', 'delete', 'exit'])
+
+    def test_delete_blob_exception(self):
+        self.fsclient_mock.return_value.export_feature_values.side_effect = Exception('ow')
+
+        with self.assertRaises(Exception):
+            tool = self._minimal_initialization()
+            tool.execute()
+
+        self.storage_blob_mock.return_value.delete.assert_called_once_with()
+
+    def test_delete_blob_failure(self):
+        self.storage_blob_mock.return_value.delete.side_effect = Exception('ow')
+
+        with self.assertRaises(Exception):
+            tool = self._minimal_initialization()
+            tool.execute()
+
+        self.open_mock.assert_not_called()
+
     def test_write_to_file(self):
-        tool = data_exporter.DataExporter('project-id', 'region',
-            'gs://scratch-bucket/', 'export.txt', '.*', '.*')
+        tool = self._minimal_initialization()
+        tool.execute()
+
+        self.open_mock.assert_called_with('export.txt', 'wb',
+                                          buffering=data_exporter.WRITE_BUFFER_SIZE)
+        self.open_mock.return_value.__enter__.return_value.write.assert_called_once_with(
+            b'featurestores/featurestore-id/entityTypes/entity-type-id/'
+            b'entities/entity-id/features/feature-id/featureDataTypes/STRING/'
+            b'featureValues/feature-value\r\n')
+
+    def test_write_to_file_repeated_entity(self):
+        self.csv_mock.reader.return_value.__iter__.return_value = iter(
+            [['feature_timestamp', 'entity_type_entity-type-id', 'feature-id'],
+             ['2022-08-02 21:30:40.761 UTC', 'entity-id', 'old-value'],
+             ['2022-08-02 21:30:40.761 UTC', 'entity-id-2', 'feature-value-2'],
+             ['2022-08-03 21:30:40.761 UTC', 'entity-id', 'new-value']]
+        )
+
+        tool = self._minimal_initialization()
+        tool.execute()
+
+        self.open_mock.return_value.__enter__.return_value.write.assert_called_once_with(
+            b'featurestores/featurestore-id/entityTypes/entity-type-id/'
+            b'entities/entity-id/features/feature-id/featureDataTypes/STRING/'
+            b'featureValues/new-value\r\n'
+            b'featurestores/featurestore-id/entityTypes/entity-type-id/'
+            b'entities/entity-id-2/features/feature-id/featureDataTypes/STRING/'
+            b'featureValues/feature-value-2\r\n')
+
+    def test_write_to_file_blank_and_short_lines(self):
+        self.csv_mock.reader.return_value.__iter__.return_value = iter(
+            [['feature_timestamp', 'entity_type_entity-type-id', 'feature-id'],
+             [],
+             ['2022-08-02 21:30:40.761 UTC', 'entity-id'],
+             ['2022-08-02 21:30:40.761 UTC'],
+             ['2022-08-02 21:30:40.761 UTC', 'entity-id-2', 'feature-value-2']]
+        )
+
+        tool = self._minimal_initialization()
+        tool.execute()
+
+        self.open_mock.return_value.__enter__.return_value.write.assert_called_once_with(
+            b'featurestores/featurestore-id/entityTypes/entity-type-id/'
+            b'entities/entity-id/features/feature-id/featureDataTypes/STRING/'
+            b'featureValues/\r\n'
+            b'featurestores/featurestore-id/entityTypes/entity-type-id/'
+            b'entities/entity-id-2/features/feature-id/featureDataTypes/STRING/'
+            b'featureValues/feature-value-2\r\n')
+
+    def test_write_to_file_empty_export(self):
+        self.csv_mock.reader.return_value.__iter__.return_value = iter([])
+
+        tool = self._minimal_initialization()
         tool.execute()
 
-        self.open_mock.assert_called_with('export.txt', 'w', newline='')
-        self.csv_mock.writer.assert_called_with(self.open_mock.return_value.__enter__.return_value, delimiter='/')
-        self.csv_mock.writer.return_value.writerow.assert_called_with(
-            ['featurestores', 'featurestore-id', 'entityTypes',
-             'entity-type-id', 'entities', 'entity-id', 'features',
-             'feature-id', 'featureDataTypes', 'STRING', 'featureValues',
-             'feature-value'])
+        self.open_mock.return_value.__enter__.return_value.write.assert_not_called()
+
+    def test_write_to_file_quoted_value(self):
+        tool = self._minimal_initialization()
+        tool._write_to_file(self.exported_data(['entity-id'], ['a "b"/c']))
+
+        self.open_mock.return_value.__enter__.return_value.write.assert_called_once_with(
+            b'featurestores/featurestore-id/entityTypes/entity-type-id/'
+            b'entities/entity-id/features/feature-id/featureDataTypes/STRING/'
+            b'featureValues/"a ""b""/c"\r\n')
+
+    def test_write_to_file_quoted_entity_id(self):
+        tool = self._minimal_initialization()
+        tool._write_to_file(self.exported_data(
+            ['entity/id', 'entity-id-2'], ['feature-value', 'feature-value-2']))
+
+        self.open_mock.return_value.__enter__.return_value.write.assert_called_once_with(
+            b'featurestores/featurestore-id/entityTypes/entity-type-id/'
+            b'entities/"entity/id"/features/feature-id/featureDataTypes/STRING/'
+            b'featureValues/feature-value\r\n'
+            b'featurestores/featurestore-id/entityTypes/entity-type-id/'
+            b'entities/entity-id-2/features/feature-id/featureDataTypes/STRING/'
+            b'featureValues/feature-value-2\r\n')
+
+    def test_write_to_file_in_batches(self):
+        self.enter_context(
+            absltest.mock.patch.object(data_exporter, 'WRITE_BATCH_SIZE', 1))
+
+        tool = self._minimal_initialization()
+        tool._write_to_file(self.exported_data(
+            ['entity-id', 'entity-id-2'], ['feature-value', 'feature-value-2']))
+
+        self.open_mock.return_value.__enter__.return_value.write.assert_has_calls([
+            absltest.mock.call(
+                b'featurestores/featurestore-id/entityTypes/entity-type-id/'
+                b'entities/entity-id/features/feature-id/featureDataTypes/STRING/'
+                b'featureValues/feature-value\r\n'),
+            absltest.mock.call(
+                b'featurestores/featurestore-id/entityTypes/entity-type-id/'
+                b'entities/entity-id-2/features/feature-id/featureDataTypes/STRING/'
+                b'featureValues/feature-value-2\r\n')])
 
     def test_filter_in_featurestores(self):
         self.featurestore_mock = absltest.mock.create_autospec(featurestore_pb2)
@@ -213,12 +442,29 @@ class DataExporterTest(absltest.TestCase):
 
         self.fsclient_mock.return_value.list_featurestores.return_value = [self.featurestore_mock]
 
-        tool = data_exporter.DataExporter('project-id', 'region',
-            'gs://scratch-bucket/', 'export.txt', 'd.*', '.*')
+        tool = self._minimal_initialization(featurestore_id_regex='d.*')
         tool.execute()
 
         self.fsclient_mock.return_value.list_entity_types.assert_called_with(
-            parent=self.featurestore_mock.name)
+            request={'parent': self.featurestore_mock.name,
+                     'page_size': data_exporter.ENTITY_TYPE_PAGE_SIZE,
+                     'read_mask': data_exporter.NAME_READ_MASK})
+
+    def test_filter_featurestores_anchored(self):
+        dog_mock = absltest.mock.create_autospec(featurestore_pb2)
+        dog_mock.name = 'projects/project-number/locations/region/featurestores/dog'
+        dogs_mock = absltest.mock.create_autospec(featurestore_pb2)
+        dogs_mock.name = 'projects/project-number/locations/region/featurestores/dogs'
+
+        self.fsclient_mock.return_value.list_featurestores.return_value = [dog_mock, dogs_mock]
+
+        tool = self._minimal_initialization(featurestore_id_regex='^dog$')
+        tool.execute()
+
+        self.fsclient_mock.return_value.list_entity_types.assert_called_once_with(
+            request={'parent': dog_mock.name,
+                     'page_size': data_exporter.ENTITY_TYPE_PAGE_SIZE,
+                     'read_mask': data_exporter.NAME_READ_MASK})
 
     def test_filter_out_featurestores(self):
         self.featurestore_mock = absltest.mock.create_autospec(featurestore_pb2)
@@ -226,8 +472,7 @@ class DataExporterTest(absltest.TestCase):
 
         self.fsclient_mock.return_value.list_featurestores.return_value = [self.featurestore_mock]
 
-        tool = data_exporter.DataExporter('project-id', 'region',
-            'gs://scratch-bucket/', 'export.txt', 'd.*', '.*')
+        tool = self._minimal_initialization(featurestore_id_regex='d.*')
         tool.execute()
 
         self.fsclient_mock.return_value.list_entity_types.assert_not_called()
@@ -238,12 +483,29 @@ class DataExporterTest(absltest.TestCase):
 
         self.fsclient_mock.return_value.list_entity_types.return_value = [self.entity_type_mock]
 
-        tool = data_exporter.DataExporter('project-id', 'region',
-            'gs://scratch-bucket/', 'export.txt', '.*', 'd.*')
+        tool = self._minimal_initialization(entity_type_id_regex='d.*')
         tool.execute()
 
         self.fsclient_mock.return_value.list_features.assert_called_with(
-            parent=self.entity_type_mock.name)
+            request={'parent': self.entity_type_mock.name,
+                     'page_size': data_exporter.FEATURE_PAGE_SIZE,
+                     'read_mask': data_exporter.FEATURE_READ_MASK})
+
+    def test_filter_entity_types_anchored(self):
+        dog_mock = absltest.mock.create_autospec(entity_type_pb2)
+        dog_mock.name = 'projects/project-number/locations/region/featurestores/featurestore-id/entityTypes/dog'
+        hotdog_mock = absltest.mock.create_autospec(entity_type_pb2)
+        hotdog_mock.name = 'projects/project-number/locations/region/featurestores/featurestore-id/entityTypes/hotdog'
+
+        self.fsclient_mock.return_value.list_entity_types.return_value = [dog_mock, hotdog_mock]
+
+        tool = self._minimal_initialization(entity_type_id_regex='dog$')
+        tool.execute()
+
+        self.fsclient_mock.return_value.list_features.assert_called_once_with(
+            request={'parent': dog_mock.name,
+                     'page_size': data_exporter.FEATURE_PAGE_SIZE,
+                     'read_mask': data_exporter.FEATURE_READ_MASK})
 
     def test_filter_out_entity_types(self):
         self.entity_type_mock = absltest.mock.create_autospec(entity_type_pb2)
@@ -251,18 +513,74 @@ class DataExporterTest(absltest.TestCase):
 
         self.fsclient_mock.return_value.list_entity_types.return_value = [self.entity_type_mock]
 
-        tool = data_exporter.DataExporter('project-id', 'region',
-            'gs://scratch-bucket/', 'export.txt', '.*', 'd.*')
+        tool = self._minimal_initialization(entity_type_id_regex='d.*')
         tool.execute()
 
         self.fsclient_mock.return_value.list_features.assert_not_called()
 
+    def test_export_multiple_entity_types(self):
+        entity_type_mock_2 = absltest.mock.create_autospec(entity_type_pb2)
+        entity_type_mock_2.name = 'projects/project-number/locations/region/featurestores/featurestore-id/entityTypes/entity-type-id-2'
+
+        self.fsclient_mock.return_value.list_entity_types.return_value = [
+            self.entity_type_mock, entity_type_mock_2]
+
+        tool = self._minimal_initialization()
+        tool.execute()
+
+        self.fsclient_mock.return_value.list_features.assert_has_calls([
+            absltest.mock.call(
+                request={'parent': self.entity_type_mock.name,
+                         'page_size': data_exporter.FEATURE_PAGE_SIZE,
+                         'read_mask': data_exporter.FEATURE_READ_MASK}),
+            absltest.mock.call(
+                request={'parent': entity_type_mock_2.name,
+                         'page_size': data_exporter.FEATURE_PAGE_SIZE,
+                         'read_mask': data_exporter.FEATURE_READ_MASK})],
+            any_order=True)
+        self.assertEqual(self.storage_blob_mock.return_value.delete.call_count, 2)
+        self.assertEqual(self.fsclient_mock.call_count,
+                         data_exporter.FEATURESTORE_CHANNEL_POOL_SIZE)
+        self.storage_mock.Client.assert_called_once()
+        self.storage_bucket_mock.assert_called_once_with('scratch-bucket')
+        self.full_export.assert_called_once_with()
+        self.feature_selector_mock.assert_called_once_with(
+            id_matcher = self.id_matcher_mock.return_value)
+
+    def test_reuse_clients(self):
+        for _ in range(2):
+            tool = self._minimal_initialization()
+            tool.execute()
+
+        self.assertEqual(self.fsclient_mock.call_count,
+                         data_exporter.FEATURESTORE_CHANNEL_POOL_SIZE)
+        self.storage_mock.Client.assert_called_once()
+
     def test_bad_gs_path(self):
         with self.assertRaises(ValueError):
-            tool = data_exporter.DataExporter('project-id', 'region',
-            '//scratch_space/some/path', 'export.txt', '.*', 'd.*')
+            tool = self._minimal_initialization('//scratch_space/some/path')
             tool.execute()
 
 
+    def test_bad_gs_path_no_bucket(self):
+        with self.assertRaises(ValueError):
+            self._minimal_initialization('gs:///some/path')
+
+    def test_gs_path_bucket_only(self):
+        tool = self._minimal_initialization('gs://scratch-bucket')
+        tool.execute()
+
+        self.storage_bucket_mock.assert_called_with('scratch-bucket')
+        self.storage_list_blobs_mock.assert_called_with(prefix='entity-type-id_d3d75a/')
+
+    def test_gs_path_with_folder(self):
+        tool = self._minimal_initialization('gs://scratch-bucket/some/path')
+        tool.execute()
+
+        self.storage_bucket_mock.assert_called_with('scratch-bucket')
+        self.storage_list_blobs_mock.assert_called_with(prefix='some/path/entity-type-id_d3d75a/')
+        self.io_pb2_mock.GcsDestination.assert_called_with(
+            output_uri_prefix='gs://scratch-bucket/some/path/entity-type-id_d3d75a')
+
 if __name__ == '__main__':
     absltest.main()
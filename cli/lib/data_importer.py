@@ -13,12 +13,18 @@
 # limitations under the License.
 
 from collections import defaultdict
+from concurrent.futures import as_completed
+from concurrent.futures import Future
+from concurrent.futures import ThreadPoolExecutor
 import csv
-from io import StringIO
+from itertools import chain
+from itertools import islice
+from itertools import zip_longest
+from operator import itemgetter
 from os import path
 import re
-from typing import Any
-from uuid import uuid4
+from secrets import token_hex
+from typing import Any, Iterable, Iterator, Optional, TextIO
 
 from absl import logging
 from google.cloud import storage
@@ -29,12 +35,25 @@ from google.cloud.aiplatform_v1.types import featurestore as featurestore_pb2
 from google.cloud.aiplatform_v1.types import featurestore_service as featurestore_service_pb2
 from google.cloud.aiplatform_v1.types import io as io_pb2
 from google.protobuf.timestamp_pb2 import Timestamp
-from lib.featurestore_data_classes import Entity
 from lib.featurestore_data_classes import EntityType
 from lib.featurestore_data_classes import Featurestore
-
-GS_ORIGINAL_PATH_FORMAT = '^gs://(?P<bucket_name>[^/]+)/?(?P<blob_name>.*)$'
-GS_FINAL_PATH_FORMAT = '^gs://(?P<bucket_name>[^/]+)/(?P<blob_name>.+)$'
+from lib.gcs_utils import split_gcs_path
+
+# A line of the flat data file alternates between keywords and values:
+# featurestores/<id>/entityTypes/<id>/entities/<id>/features/<id>/
+# featureDataTypes/<type>/featureValues/<value>
+ROW_LENGTH = 12
+ROW_VALUES = itemgetter(1, 3, 5, 7, 9, 11)
+# Characters that make csv.writer quote a field
+CSV_QUOTED_CHARACTERS_PATTERN = re.compile('[,"\r\n]')
+UPLOAD_BATCH_SIZE = 10000  # rows
+READ_BUFFER_SIZE = 4 * 1024 * 1024  # bytes
+MAX_UPLOAD_WORKERS = 32
+MAX_SCHEMA_WORKERS = 16
+# Smaller than the 40 MiB default so the upload starts while rows are written
+UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024  # bytes
+# Files up to one upload chunk are uploaded in a single request
+SINGLE_REQUEST_UPLOAD_BYTES = UPLOAD_CHUNK_SIZE
 
 
 class DataImporter:
@@ -52,40 +71,104 @@ class DataImporter:
           gcs_path: Storage path (temporarily used to load data into the
             featurestores); e.g. gs://scratch_bucket/.
     """
-    if not re.match(GS_ORIGINAL_PATH_FORMAT, gcs_path):
-      raise ValueError(f'Not a valid GS path format: {gcs_path}')
+    self._gcs_bucket_name, self._gcs_blob_prefix = split_gcs_path(gcs_path)
     self._project_id = project_id
     self._region = region
     self._import_file_path = import_file_path
     self._gcs_path = gcs_path
     self._api_endpoint = f'{region}-aiplatform.googleapis.com'
+    # Makes the names this import creates unique
+    self._id_suffix = token_hex(3)
 
-  def _upload_data(self, featurestore_client: FeaturestoreServiceClient,
+  def _import_data(self, featurestore_client: FeaturestoreServiceClient,
+                   gcs_bucket: storage.Bucket,
                    featurestores: list[Featurestore]) -> None:
-    """Upload data to FeatureStore instance.
+    """Create the featurestores and import their data.
 
         Args:
             featurestore_client: FeatureStore service client for FS instance to
               upload to.
-            featurestores: Featurestores with data to upload.
+            gcs_bucket: GCS bucket to upload the data files into.
+            featurestores: Featurestores with data to import.
     """
-    for featurestore_id, featurestore in featurestores.items():
-      for entity_type_id, entity_type in featurestore.entity_types.items():
-        logging.info(f"Uploading data for entity type '{entity_type_id}'...")
-        filepath, blob = self._create_blob_object(entity_type_id)
-        try:
-          entity_id_column_id = self._upload_data_file(entity_type, blob)
-          self._run_data_ingestion_job(featurestore_client, featurestore_id,
-                                       entity_type_id, entity_type, filepath,
-                                       entity_id_column_id)
-        finally:
-          blob.delete()
+    common_location_path = featurestore_client.common_location_path(
+        self._project_id, self._region)
+    # All the data is imported as of the same time
+    feature_time = Timestamp()
+    feature_time.GetCurrentTime()
+    # Can't be higher resolution than milliseconds
+    feature_time.nanos = (feature_time.nanos // 1000000) * 1000000
+    # Featurestores take the longest to create, so every entity type's file is
+    # uploaded meanwhile. The entity types are otherwise independent and
+    # their ingestion jobs mostly wait on the service, so run them all at once.
+    with ThreadPoolExecutor(
+        max_workers=MAX_SCHEMA_WORKERS) as featurestore_executor, \
+        ThreadPoolExecutor(max_workers=MAX_UPLOAD_WORKERS) as executor:
+      futures = []
+      for featurestore_id, featurestore in featurestores.items():
+        featurestore_future = featurestore_executor.submit(
+            self._create_featurestore, featurestore_client,
+            common_location_path, featurestore_id)
+        featurestore_path = featurestore_client.featurestore_path(
+            self._project_id, self._region, featurestore_id)
+        for entity_type_id, entity_type in featurestore.entity_types.items():
+          futures.append(
+              executor.submit(self._import_entity_type_data,
+                              featurestore_client, gcs_bucket,
+                              featurestore_future,
+                              featurestore_path, featurestore_id,
+                              entity_type_id, entity_type, feature_time))
+      # Surface the first failure, dropping the imports that haven't started;
+      # the ones already running are still waited on when the executors close
+      try:
+        for future in as_completed(futures):
+          future.result()
+      except Exception:
+        featurestore_executor.shutdown(wait=False, cancel_futures=True)
+        executor.shutdown(wait=False, cancel_futures=True)
+        raise
+
+  def _import_entity_type_data(self,
+                               featurestore_client: FeaturestoreServiceClient,
+                               gcs_bucket: storage.Bucket,
+                               featurestore_future: Future,
+                               featurestore_path: str, featurestore_id: str,
+                               entity_type_id: str, entity_type: EntityType,
+                               feature_time: Timestamp) -> None:
+    """Create an entity type and import its data.
+
+        Args:
+            featurestore_client: FeatureStore service client for FS instance to
+              upload to.
+            gcs_bucket: GCS bucket to upload the data file into.
+            featurestore_future: Future of the creation of the featurestore.
+            featurestore_path: Path to the featurestore.
+            featurestore_id: ID of the featurestore.
+            entity_type_id: ID of the entity type.
+            entity_type: Entity type with data to import.
+            feature_time: Time of the imported feature values.
+    """
+    logging.info(f"Uploading data for entity type '{entity_type_id}'...")
+    filepath, blob = self._create_blob_object(gcs_bucket, featurestore_id,
+                                              entity_type_id)
+    try:
+      entity_id_column_id = self._upload_data_file(entity_type, blob)
+      featurestore_future.result()
+      self._create_entity_type_schema(featurestore_client, featurestore_path,
+                                      featurestore_id, entity_type_id,
+                                      entity_type)
+      self._run_data_ingestion_job(featurestore_client, featurestore_id,
+                                   entity_type_id, entity_type, filepath,
+                                   entity_id_column_id, feature_time)
+    finally:
+      blob.delete()
 
   def _run_data_ingestion_job(self,
                               featurestore_client: FeaturestoreServiceClient,
                               featurestore_id: str, entity_type_id: str,
                               entity_type: EntityType, filepath: str,
-                              entity_id_column_id: str) -> None:
+                              entity_id_column_id: str,
+                              feature_time: Timestamp) -> None:
     """Run a data ingestion job for an entity type to upload data to a FeatureStore instance.
 
         Args:
@@ -96,12 +179,8 @@ class DataImporter:
           entity_type: Entity type object of data being uploaded.
           filepath: File with CSV of data to upload.
           entity_id_column_id: ID of the column containing the row's entity ID.
+          feature_time: Time of the imported feature values.
     """
-    current_time = Timestamp()
-    current_time.GetCurrentTime()
-    # Can't be higher resolution than milliseconds
-    current_time.nanos = (current_time.nanos // 1000000) * 1000000
-
     featurestore_client.import_feature_values(
         featurestore_service_pb2.ImportFeatureValuesRequest(
             entity_type=featurestore_client.entity_type_path(
@@ -115,7 +194,7 @@ class DataImporter:
                 featurestore_service_pb2.ImportFeatureValuesRequest.FeatureSpec(
                     id=x) for x in entity_type.features_metadata
             ],
-            feature_time=current_time,
+            feature_time=feature_time,
             worker_count=1,
             disable_ingestion_analysis=True,
         )).result()
@@ -130,28 +209,48 @@ class DataImporter:
         Returns:
           ID of the column containing the row's entity ID.
     """
-    with StringIO(newline='') as csv_file:
-      csv_writer = csv.writer(csv_file)
-      entity_id_column_id = self._write_header(entity_type, csv_writer)
-      for entity_id, entity in entity_type.entities.items():
-        self._write_row(entity_type, csv_writer, entity_id, entity)
-      blob.upload_from_file(csv_file, rewind=True, content_type='text/csv')
-      return entity_id_column_id
-
-  def _write_row(self, entity_type: EntityType, csv_writer: Any, entity_id: str,
-                 entity: Entity) -> None:
-    """Write a row (1 entity) to the CSV file.
+    csv_file = _BlobUploadFile(blob)
+    entity_id_column_id = self._write_file(entity_type, csv_file)
+    csv_file.close()
+    return entity_id_column_id
+
+  def _write_file(self, entity_type: EntityType, csv_file: TextIO) -> str:
+    """Write the CSV data file.
+
+        Args:
+          entity_type: Entity type of data in the file.
+          csv_file: The CSV file.
+
+        Returns:
+          ID of the column containing the row's entity ID.
+    """
+    csv_writer = csv.writer(csv_file)
+    entity_id_column_id = self._write_header(entity_type, csv_writer)
+    self._write_rows(entity_type, csv_file, csv_writer)
+    return entity_id_column_id
+
+  def _write_rows(self, entity_type: EntityType, csv_file: TextIO,
+                  csv_writer: Any) -> None:
+    """Write the rows (1 per entity) to the CSV file.
 
         Args:
           entity_type: Entity type object for the data.
+          csv_file: The CSV file.
           csv_writer: Writer for the CSV file.
-          entity_id: ID of the entity.
-          entity: Entity object.
     """
-    entity_data = [entity_id]
-    for feature_metadata_id in entity_type.features_metadata:
-      entity_data.append(entity.features[feature_metadata_id].value)
-    csv_writer.writerow(entity_data)
+    # A column ends at its last stored value, so pad it with blanks
+    rows = zip_longest(
+        entity_type.entity_ids,
+        *(entity_type.columns[feature_metadata_id]
+          for feature_metadata_id in entity_type.features_metadata),
+        fillvalue='')
+    while batch := list(islice(rows, UPLOAD_BATCH_SIZE)):
+      # Fields rarely need quoting, and then the lines are just the joined
+      # fields, which is much cheaper than going through csv.writer
+      if CSV_QUOTED_CHARACTERS_PATTERN.search(''.join(map(''.join, batch))):
+        csv_writer.writerows(batch)
+      else:
+        csv_file.write('\r\n'.join(map(','.join, batch)) + '\r\n')
 
   def _write_header(self, entity_type: EntityType, csv_writer: Any) -> str:
     """Write the header of the CSV file.
@@ -163,29 +262,31 @@ class DataImporter:
         Returns:
           ID of the column containing the row's entity ID.
     """
-    entity_id_column_id = f'entity_id_{str(uuid4())[:5]}'
+    entity_id_column_id = f'entity_id_{self._id_suffix}'
     header_data = [entity_id_column_id]
     header_data.extend(entity_type.features_metadata.keys())
     csv_writer.writerow(header_data)
     return entity_id_column_id
 
-  def _create_blob_object(self,
+  def _create_blob_object(self, gcs_bucket: storage.Bucket,
+                          featurestore_id: str,
                           entity_type_id: str) -> tuple[str, storage.Blob]:
     """Create a GCS blob object for an entity type's data.
 
         Args:
+          gcs_bucket: GCS bucket to create the blob in.
+          featurestore_id: ID of the featurestore the entity type belongs to.
           entity_type_id: ID of the entity type to create the blob for.
 
         Returns:
           Filepath to blob.
           Created blob object.
     """
-    filename = f'{entity_type_id}_{str(uuid4())[:5]}.csv'  # uuid to ensure uniqueness
+    # Entity type IDs are only unique within a featurestore and the entity
+    # types are imported concurrently, so each featurestore gets its own folder
+    filename = path.join(featurestore_id, f'{entity_type_id}.csv')
     filepath = path.join(self._gcs_path, filename)
-    gcs_client = storage.Client(self._project_id)
-    match = re.match(GS_FINAL_PATH_FORMAT, filepath)
-    bucket = gcs_client.bucket(match.group('bucket_name'))
-    blob = bucket.blob(match.group('blob_name'))
+    blob = gcs_bucket.blob(path.join(self._gcs_blob_prefix, filename))
     return filepath, blob
 
   def _parse_schema_and_data(self) -> list[Featurestore]:
@@ -199,25 +300,50 @@ class DataImporter:
     # So map them to a more unique name
     featurestore_id_map = {}
 
-    with open(self._import_file_path, newline='') as file:
+    with open(self._import_file_path, newline='',
+              buffering=READ_BUFFER_SIZE) as file:
       logging.info(f"Parsing file '{self._import_file_path}'...")
-      data_reader = csv.reader(file, delimiter='/')
-      for row in data_reader:
-        success, featurestore_id, entity_type_id, entity_id, feature_id, \
-            feature_data_type, feature_value = self._parse_values(row)
-        if success:
-          self._store_values(featurestores, featurestore_id_map,
-                             featurestore_id, entity_type_id, entity_id,
-                             feature_id, feature_data_type, feature_value)
+      # Lines only need resolving to their column the first time their
+      # featurestore, entity type and feature are seen
+      located_columns = {}
+      # Row of each entity ID in its entity type's columns
+      entity_type_rows = {}
+      for (featurestore_id, entity_type_id, entity_id, feature_id,
+           feature_data_type, feature_value) in self._parse_values(
+               self._split_lines(file)):
+        key = (featurestore_id, entity_type_id, feature_id)
+        located_column = located_columns.get(key)
+        if located_column is None:
+          located_column = self._locate_column(featurestores,
+                                               featurestore_id_map,
+                                               featurestore_id, entity_type_id,
+                                               feature_id, feature_data_type)
+          if located_column is None:
+            continue
+          located_column = located_columns[key] = (
+              *located_column,
+              entity_type_rows.setdefault((featurestore_id, entity_type_id),
+                                          {}))
+        # Stored inline, as this runs for every line of the file
+        entity_type, column, entity_rows = located_column
+        # TODO: Add support for entities with multiple IDs?
+        row = entity_rows.get(entity_id)
+        if row is None:
+          row = entity_rows[entity_id] = len(entity_type.entity_ids)
+          entity_type.entity_ids.append(entity_id)
+        if row < len(column):
+          column[row] = feature_value
         else:
-          logging.warning('Failed to parse line: %s', '/'.join(row))
+          # Entities without a value for the feature are left blank
+          column.extend([''] * (row - len(column)))
+          column.append(feature_value)
       return featurestores
 
-  def _store_values(self, featurestores: list[Featurestore],
-                    featurestore_id_map: str, featurestore_id: str,
-                    entity_type_id: str, entity_id: str, feature_id: str,
-                    feature_data_type: str, feature_value: str) -> None:
-    """Stores the values from a parsed line of the input file.
+  def _locate_column(
+      self, featurestores: list[Featurestore], featurestore_id_map: str,
+      featurestore_id: str, entity_type_id: str, feature_id: str,
+      feature_data_type: str) -> Optional[tuple[EntityType, list[str]]]:
+    """Locate the column of a feature, setting up its metadata if needed.
 
         Args:
             featurestores: featurestore data structure to store data in.
@@ -225,20 +351,22 @@ class DataImporter:
               the generated unique names.
             featurestore_id: ID of featurestore.
             entity_type_id: ID of entity type.
-            entity_id: ID of entity.
             feature_id: ID of feature.
             feature_data_type: Data type of feature (may be blank if already
               known).
-            feature_value: Value of feature.
+
+        Returns:
+            Entity type of the feature and the feature's column, or None if
+            the feature's values can't be stored.
     """
     featurestore = self._map_featurestore(featurestores, featurestore_id_map,
                                           featurestore_id)
     entity_type = featurestore.entity_types[entity_type_id]
     success = self._set_feature_metadata(feature_id, feature_data_type,
                                          entity_type)
-    # TODO: Add support for entities with multiple IDs?
-    if success:
-      entity_type.entities[entity_id].features[feature_id].value = feature_value
+    if not success:
+      return None
+    return entity_type, entity_type.columns.setdefault(feature_id, [])
 
   def _set_feature_metadata(self, feature_id: str, feature_data_type: str,
                             entity_type: EntityType) -> bool:
@@ -290,19 +418,40 @@ class DataImporter:
     """
     if featurestore_id not in featurestore_id_map:
       featurestore_id_map[
-          featurestore_id] = f'{featurestore_id}_{str(uuid4())[:5]}'
+          featurestore_id] = f'{featurestore_id}_{self._id_suffix}'
     featurestore_id = featurestore_id_map[featurestore_id]
     return featurestores[featurestore_id]
 
+  def _split_lines(self, file: TextIO) -> Iterator[list[str]]:
+    """Split the lines of the flat data file on '/'.
+
+        A plain split is much cheaper than csv.reader, which is only needed for
+        the rare lines with quoted fields.
+
+        Args:
+            file: The flat data file.
+
+        Yields:
+            Fields of each line.
+    """
+    for line in file:
+      if '"' in line:
+        # A quoted field can span lines, so the reader takes them from the file
+        yield next(csv.reader(chain([line], file), delimiter='/'))
+      else:
+        yield line.rstrip('\r\n').split('/')
+
   def _parse_values(
-      self, row: list[str]) -> tuple[bool, str, str, str, str, str, str]:
-    """Parse the values on a line of the flat data file.
+      self, rows: Iterable[list[str]]
+  ) -> Iterator[tuple[str, str, str, str, str, str]]:
+    """Parse the values on the lines of the flat data file.
+
+        Lines that can't be parsed are logged and skipped.
 
         Args:
-            line: Line of text.
+            rows: Lines of the file, split on '/'.
 
-        Returns:
-            Whether the line could be successfully parsed.
+        Yields:
             ID of the featurestore.
             ID of the entity type.
             ID of the entity.
@@ -310,41 +459,33 @@ class DataImporter:
             Data type of the feature.
             Value of the feature for the entity.
     """
-    if len(row) != 12:
-      return False, '', '', '', '', '', ''
-
-    row = [row[1], row[3], row[5], row[7], row[9], row[11]]
-
-    featurestore_id, entity_type_id, entity_id, feature_id, feature_data_type, \
-        feature_value = row
-    return True, featurestore_id, entity_type_id, entity_id, feature_id, \
-        feature_data_type, feature_value
-
-  def _create_schema(self, featurestore_client: FeaturestoreServiceClient,
-                     featurestores: list[Featurestore]) -> None:
-    """Create featurestore schema.
+    for row in rows:
+      if len(row) == ROW_LENGTH:
+        yield ROW_VALUES(row)
+      else:
+        logging.warning('Failed to parse line: %s', '/'.join(row))
+
+  def _create_entity_type_schema(self,
+                                 featurestore_client: FeaturestoreServiceClient,
+                                 featurestore_path: str, featurestore_id: str,
+                                 entity_type_id: str,
+                                 entity_type: EntityType) -> None:
+    """Create an entity type and its features.
 
         Args:
             featurestore_client: FeatureStore service client for FS instance to
               upload to.
-            festurestores: Featurestores whose schema to create.
+            featurestore_path: Path to the featurestore.
+            featurestore_id: ID of the featurestore.
+            entity_type_id: ID of the entity type to create.
+            entity_type: Entity type whose schema to create.
     """
-    common_location_path = featurestore_client.common_location_path(
-        self._project_id, self._region)
-    for featurestore_id, featurestore in featurestores.items():
-      self._create_featurestore(featurestore_client, common_location_path,
-                                featurestore_id)
+    self._create_entity_type(featurestore_client, featurestore_path,
+                             entity_type_id)
 
-      for entity_type_id, entity_type in featurestore.entity_types.items():
-        featurestore_path = featurestore_client.featurestore_path(
-            self._project_id, self._region, featurestore_id)
-        self._create_entity_type(featurestore_client, featurestore_path,
-                                 entity_type_id)
-
-        entity_type_path = featurestore_client.entity_type_path(
-            self._project_id, self._region, featurestore_id, entity_type_id)
-        self._create_features(featurestore_client, entity_type_path,
-                              entity_type)
+    entity_type_path = featurestore_client.entity_type_path(
+        self._project_id, self._region, featurestore_id, entity_type_id)
+    self._create_features(featurestore_client, entity_type_path, entity_type)
 
   def _create_features(self, featurestore_client: FeaturestoreServiceClient,
                        entity_type_path: str, entity_type: EntityType) -> None:
@@ -417,5 +558,58 @@ class DataImporter:
     if featurestores:
       featurestore_client = FeaturestoreServiceClient(
           client_options={'api_endpoint': self._api_endpoint})
-      self._create_schema(featurestore_client, featurestores)
-      self._upload_data(featurestore_client, featurestores)
+      # Shared by every entity type's upload, so its credentials and
+      # connections are set up once
+      gcs_bucket = storage.Client(self._project_id).bucket(
+          self._gcs_bucket_name)
+      self._import_data(featurestore_client, gcs_bucket, featurestores)
+
+
+class _BlobUploadFile:
+  """Text file uploaded to a GCS blob as CSV.
+
+  The data is held in memory while it fits in SINGLE_REQUEST_UPLOAD_BYTES and
+  uploaded in a single request, which is quicker than starting a resumable
+  upload. Past that it's streamed to GCS rather than holding the whole file in
+  memory.
+  """
+
+  def __init__(self, blob: storage.Blob):
+    """Initializes the file.
+
+        Args:
+          blob: GCS blob to upload into.
+    """
+    self._blob = blob
+    self._buffer = []
+    self._buffered_bytes = 0
+    self._stream = None
+
+  def write(self, data: str) -> None:
+    """Write data to the file.
+
+        Args:
+          data: Text to write.
+    """
+    if self._stream is not None:
+      self._stream.write(data)
+      return
+    self._buffer.append(data)
+    self._buffered_bytes += len(data) if data.isascii() else len(
+        data.encode())
+    if self._buffered_bytes > SINGLE_REQUEST_UPLOAD_BYTES:
+      self._stream = self._blob.open(
+          'w',
+          chunk_size=UPLOAD_CHUNK_SIZE,
+          newline='',
+          content_type='text/csv')
+      self._stream.write(''.join(self._buffer))
+      self._buffer = None
+
+  def close(self) -> None:
+    'Finish uploading the file.'
+    if self._stream is not None:
+      self._stream.close()
+    else:
+      self._blob.upload_from_string(''.join(self._buffer),
+                                    content_type='text/csv')
@@ -14,80 +14,78 @@
 
 """Tests for data_importer."""
 
+import csv
+
 from absl.testing import absltest
 
 import lib.data_importer as data_importer
 
 
-class DataImporterTest(absltest.TestCase):
+def import_lines(rows: list[list[str]]):
+    return iter(['/'.join(row) + '\r\n' for row in rows])
+
 
-    def get_feature_type(self, type_value: str):
-        match type_value:
-            case 'INT64':
-                return self.feature_pb2_mock.Feature.ValueType.INT64
-            case 'BOOL':
-                return self.feature_pb2_mock.Feature.ValueType.BOOL
-            case 'STRING':
-                return self.feature_pb2_mock.Feature.ValueType.STRING
-            case _:
-                raise KeyError(type_value)
+class DataImporterTest(absltest.TestCase):
 
     def setUp(self):
         super().setUp()
 
-        self.entity_type_pb2_mock = self.enter_context(
-            absltest.mock.patch.object(data_importer, 'entity_type_pb2', autospec=True))
+        # Patch all the importer's dependencies at once
+        mocks = self.enter_context(absltest.mock.patch.multiple(
+            data_importer, autospec=True, **dict.fromkeys([
+                'entity_type_pb2', 'featurestore_pb2', 'featurestore_service_pb2',
+                'io_pb2', 'token_hex', 'FeaturestoreServiceClient', 'storage',
+                'Timestamp', 'csv', 'logging'],
+                absltest.mock.DEFAULT)))
+
+        self.entity_type_pb2_mock = mocks['entity_type_pb2']
         # autospec doesn't work on the next one because it says it can't find __getitem__
         self.feature_pb2_mock = self.enter_context(
             absltest.mock.patch.object(data_importer, 'feature_pb2'))
-        self.feature_pb2_mock.Feature.ValueType.__getitem__.side_effect = self.get_feature_type
-        self.featurestore_pb2_mock = self.enter_context(
-            absltest.mock.patch.object(data_importer, 'featurestore_pb2', autospec=True))
-        self.featurestore_service_pb2_mock = self.enter_context(
-            absltest.mock.patch.object(data_importer, 'featurestore_service_pb2', autospec=True))
-        self.io_pb2_mock = self.enter_context(
-            absltest.mock.patch.object(data_importer, 'io_pb2', autospec=True))
-
-        uuid_mock = self.enter_context(
-            absltest.mock.patch.object(data_importer, 'uuid4', autospec=True))
-        uuid_mock.return_value = 'd3d75afa-a029-4842-9b77-f753661dd1f5'
-
-        self.fsclient_mock = self.enter_context(
-            absltest.mock.patch.object(data_importer, 'FeaturestoreServiceClient', autospec=True))
-
-        self.storage_mock = self.enter_context(
-            absltest.mock.patch.object(data_importer, 'storage', autospec=True))
-
-        self.timestamp_mock = self.enter_context(
-            absltest.mock.patch.object(data_importer, 'Timestamp', autospec=True))
+        value_type_mock = self.feature_pb2_mock.Feature.ValueType
+        value_type_mock.__getitem__.side_effect = {
+            'INT64': value_type_mock.INT64,
+            'BOOL': value_type_mock.BOOL,
+            'STRING': value_type_mock.STRING,
+        }.__getitem__
+        self.featurestore_pb2_mock = mocks['featurestore_pb2']
+        self.featurestore_service_pb2_mock = mocks['featurestore_service_pb2']
+        self.io_pb2_mock = mocks['io_pb2']
+
+        self.token_hex_mock = mocks['token_hex']
+        self.token_hex_mock.return_value = 'd3d75a'
+
+        self.fsclient_mock = mocks['FeaturestoreServiceClient']
+
+        self.storage_mock = mocks['storage']
+
+        self.timestamp_mock = mocks['Timestamp']
         # set default value for attr created in __init__()
         self.timestamp_mock.return_value.nanos = 0
 
         # Open is a native method so it can't be autospec'ed
         self.open_mock = self.enter_context(
             absltest.mock.patch.object(data_importer, 'open'))
+        self.import_file_mock = self.open_mock.return_value.__enter__.return_value
 
-        self.csv_mock = self.enter_context(
-            absltest.mock.patch.object(data_importer, 'csv', autospec=True))
+        self.csv_mock = mocks['csv']
 
-        self.stringio_mock = self.enter_context(
-            absltest.mock.patch.object(data_importer, 'StringIO', autospec=True))
-
-        self.logging_mock = self.enter_context(
-            absltest.mock.patch.object(data_importer, 'logging', autospec=True))
+        self.logging_mock = mocks['logging']
 
     def test_empty_file(self):
-        self.csv_mock.reader.return_value.__iter__.return_value = []
+        self.import_file_mock.__iter__.return_value = iter([])
 
         tool = data_importer.DataImporter(
             'project-id', 'region', 'featurestore.txt', 'gs://scratch_space/some/path')
         tool.execute()
 
         self.fsclient_mock.assert_not_called()
+        self.storage_mock.Client.assert_not_called()
+        self.timestamp_mock.assert_not_called()
         self.csv_mock.assert_not_called()
 
     def test_open_csv(self):
-        self.csv_mock.reader.return_value.__iter__.return_value = iter(
+        self.import_file_mock.__iter__.return_value = import_lines(
             [['featurestores', 'benchmark_featurestore', 'entityTypes', 'human',
               'entities', 'bob', 'features', 'height', 'featureDataTypes',
               'int64', 'featureValues', '4']])
@@ -96,12 +94,13 @@ class DataImporterTest(absltest.TestCase):
             'project-id', 'region', 'featurestore.txt', 'gs://scratch_space/some/path')
         tool.execute()
 
-        self.open_mock.assert_called_with('featurestore.txt', newline='')
-        self.csv_mock.reader.assert_called_with(self.open_mock.return_value.__enter__.return_value, delimiter='/')
-        self.csv_mock.reader.return_value.__iter__.assert_called()
+        self.open_mock.assert_called_with(
+            'featurestore.txt', newline='', buffering=data_importer.READ_BUFFER_SIZE)
+        self.import_file_mock.__iter__.assert_called()
+        self.csv_mock.reader.assert_not_called()
 
     def test_create_featurestore_client(self):
-        self.csv_mock.reader.return_value.__iter__.return_value = iter(
+        self.import_file_mock.__iter__.return_value = import_lines(
             [['featurestores', 'benchmark_featurestore', 'entityTypes', 'human',
               'entities', 'bob', 'features', 'height', 'featureDataTypes',
               'int64', 'featureValues', '4']])
@@ -114,7 +113,7 @@ class DataImporterTest(absltest.TestCase):
             client_options={"api_endpoint": 'region-aiplatform.googleapis.com'})
 
     def test_create_featurestore(self):
-        self.csv_mock.reader.return_value.__iter__.return_value = iter(
+        self.import_file_mock.__iter__.return_value = import_lines(
             [['featurestores', 'benchmark_featurestore', 'entityTypes', 'human',
               'entities', 'bob', 'features', 'height', 'featureDataTypes',
               'int64', 'featureValues', '4']])
@@ -132,13 +131,13 @@ class DataImporterTest(absltest.TestCase):
         common_location_mock.assert_called_with('project-id', 'region')
         fs_request_mock = self.featurestore_service_pb2_mock.CreateFeaturestoreRequest
         fs_request_mock.assert_called_with(parent=common_location_mock.return_value,
-                                           featurestore_id='benchmark_featurestore_d3d75',
+                                           featurestore_id='benchmark_featurestore_d3d75a',
                                            featurestore=featurestore_mock.return_value)
         self.fsclient_mock.return_value.create_featurestore.assert_called_with(
             fs_request_mock.return_value)
 
     def test_create_entity_type(self):
-        self.csv_mock.reader.return_value.__iter__.return_value = iter(
+        self.import_file_mock.__iter__.return_value = import_lines(
             [['featurestores', 'benchmark_featurestore', 'entityTypes', 'human',
               'entities', 'bob', 'features', 'height', 'featureDataTypes',
               'int64', 'featureValues', '4']])
@@ -149,7 +148,7 @@ class DataImporterTest(absltest.TestCase):
 
         featurestore_path_mock = self.fsclient_mock.return_value.featurestore_path
         featurestore_path_mock.assert_called_with(
-            'project-id', 'region', 'benchmark_featurestore_d3d75')
+            'project-id', 'region', 'benchmark_featurestore_d3d75a')
         entity_type_mock = self.entity_type_pb2_mock.EntityType
         entity_type_mock.assert_called_with(description="")
         entity_type_request_mock = self.featurestore_service_pb2_mock.CreateEntityTypeRequest
@@ -160,7 +159,7 @@ class DataImporterTest(absltest.TestCase):
             entity_type_request_mock.return_value)
 
     def test_create_features(self):
-        self.csv_mock.reader.return_value.__iter__.return_value = iter(
+        self.import_file_mock.__iter__.return_value = import_lines(
             [['featurestores', 'benchmark_featurestore', 'entityTypes', 'human',
               'entities', 'bob', 'features', 'height', 'featureDataTypes',
               'int64', 'featureValues', '4'],
@@ -177,7 +176,7 @@ class DataImporterTest(absltest.TestCase):
 
         entity_type_path_mock = self.fsclient_mock.return_value.entity_type_path
         entity_type_path_mock.assert_called_with(
-            'project-id', 'region', 'benchmark_featurestore_d3d75', 'human')
+            'project-id', 'region', 'benchmark_featurestore_d3d75a', 'human')
         feature_mock = self.feature_pb2_mock.Feature
         feature_mock.assert_any_call(
             value_type=self.feature_pb2_mock.Feature.ValueType.INT64, description='',
@@ -198,7 +197,7 @@ class DataImporterTest(absltest.TestCase):
                       feature_request_mock_2.return_value])
 
     def test_create_storage_client(self):
-        self.csv_mock.reader.return_value.__iter__.return_value = iter(
+        self.import_file_mock.__iter__.return_value = import_lines(
             [['featurestores', 'benchmark_featurestore', 'entityTypes', 'human',
               'entities', 'bob', 'features', 'height', 'featureDataTypes',
               'int64', 'featureValues', '4']])
@@ -207,10 +206,10 @@ class DataImporterTest(absltest.TestCase):
             'project-id', 'region', 'featurestore.txt', 'gs://scratch_space/some/path')
         tool.execute()
 
-        self.storage_mock.Client.assert_called_with('project-id')
+        self.storage_mock.Client.assert_called_once_with('project-id')
 
     def test_create_blob_object(self):
-        self.csv_mock.reader.return_value.__iter__.return_value = iter(
+        self.import_file_mock.__iter__.return_value = import_lines(
             [['featurestores', 'benchmark_featurestore', 'entityTypes', 'human',
               'entities', 'bob', 'features', 'height', 'featureDataTypes',
               'int64', 'featureValues', '4']])
@@ -222,10 +221,45 @@ class DataImporterTest(absltest.TestCase):
         bucket_mock = self.storage_mock.Client.return_value.bucket
         bucket_mock.assert_called_with('scratch_space')
         blob_mock = bucket_mock.return_value.blob
-        blob_mock.assert_called_with('some/path/human_d3d75.csv')
+        blob_mock.assert_called_with('some/path/benchmark_featurestore_d3d75a/human.csv')
+
+    def test_create_blob_object_per_featurestore(self):
+        self.import_file_mock.__iter__.return_value = import_lines(
+            [['featurestores', 'benchmark_featurestore', 'entityTypes', 'human',
+              'entities', 'bob', 'features', 'height', 'featureDataTypes',
+              'int64', 'featureValues', '4'],
+            ['featurestores', 'other_featurestore', 'entityTypes', 'human',
+              'entities', 'sally', 'features', 'height', 'featureDataTypes',
+              'int64', 'featureValues', '3']])
+
+        tool = data_importer.DataImporter(
+            'project-id', 'region', 'featurestore.txt', 'gs://scratch_space/some/path')
+        tool.execute()
+
+        blob_mock = self.storage_mock.Client.return_value.bucket.return_value.blob
+        blob_mock.assert_has_calls(
+            [absltest.mock.call('some/path/benchmark_featurestore_d3d75a/human.csv'),
+             absltest.mock.call('some/path/other_featurestore_d3d75a/human.csv')],
+            any_order=True)
+
+    def test_create_blob_object_bucket_only(self):
+        self.import_file_mock.__iter__.return_value = import_lines(
+            [['featurestores', 'benchmark_featurestore', 'entityTypes', 'human',
+              'entities', 'bob', 'features', 'height', 'featureDataTypes',
+              'int64', 'featureValues', '4']])
+
+        tool = data_importer.DataImporter(
+            'project-id', 'region', 'featurestore.txt', 'gs://scratch_space')
+        tool.execute()
+
+        bucket_mock = self.storage_mock.Client.return_value.bucket
+        bucket_mock.assert_called_with('scratch_space')
+        bucket_mock.return_value.blob.assert_called_with('benchmark_featurestore_d3d75a/human.csv')
+        self.io_pb2_mock.GcsSource.assert_called_with(
+            uris=['gs://scratch_space/benchmark_featurestore_d3d75a/human.csv'])
 
     def test_upload_file(self):
-        self.csv_mock.reader.return_value.__iter__.return_value = iter(
+        self.import_file_mock.__iter__.return_value = import_lines(
             [['featurestores', 'benchmark_featurestore', 'entityTypes', 'human',
               'entities', 'bob', 'features', 'height', 'featureDataTypes',
               'int64', 'featureValues', '4'],
@@ -240,18 +274,97 @@ class DataImporterTest(absltest.TestCase):
             'project-id', 'region', 'featurestore.txt', 'gs://scratch_space/some/path')
         tool.execute()
 
-        self.stringio_mock.assert_called_with(newline='')
-        self.csv_mock.writer.assert_called_with(self.stringio_mock.return_value.__enter__.return_value)
-        self.csv_mock.writer.return_value.writerow.assert_has_calls([
-            absltest.mock.call(['entity_id_d3d75', 'height', 'awake']),
-            absltest.mock.call(['bob', '4', 'True']),
-            absltest.mock.call(['sally', '3', ''])
-        ])
+        self.csv_mock.writer.assert_called_once()
+        self.csv_mock.writer.return_value.writerow.assert_called_once_with(
+            ['entity_id_d3d75a', 'height', 'awake'])
+        self.csv_mock.writer.return_value.writerows.assert_not_called()
+        blob_mock = self.storage_mock.Client.return_value.bucket.return_value.blob.return_value
+        blob_mock.upload_from_string.assert_called_once_with(
+            'bob,4,True\r\nsally,3,\r\n', content_type='text/csv')
+        blob_mock.open.assert_not_called()
+
+    def test_upload_file_stream(self):
+        self.enter_context(
+            absltest.mock.patch.object(data_importer, 'SINGLE_REQUEST_UPLOAD_BYTES', 64))
+        # Only a few fields, but they're too big for a single request
+        self.import_file_mock.__iter__.return_value = import_lines(
+            [['featurestores', 'benchmark_featurestore', 'entityTypes', 'human',
+              'entities', 'bob', 'features', 'bio', 'featureDataTypes',
+              'string', 'featureValues', 'b' * 40],
+            ['featurestores', 'benchmark_featurestore', 'entityTypes', 'human',
+              'entities', 'sally', 'features', 'bio', '',
+              '', 'featureValues', 's' * 40]])
+
+        tool = data_importer.DataImporter(
+            'project-id', 'region', 'featurestore.txt', 'gs://scratch_space/some/path')
+        tool.execute()
+
         blob_mock = self.storage_mock.Client.return_value.bucket.return_value.blob.return_value
-        blob_mock.upload_from_file.assert_called_with(self.stringio_mock.return_value.__enter__.return_value, rewind=True, content_type='text/csv')
+        blob_mock.open.assert_called_once_with(
+            'w', chunk_size=data_importer.UPLOAD_CHUNK_SIZE, newline='', content_type='text/csv')
+        stream_mock = blob_mock.open.return_value
+        stream_mock.write.assert_called_once_with(
+            f'bob,{"b" * 40}\r\nsally,{"s" * 40}\r\n')
+        stream_mock.close.assert_called_once()
+        blob_mock.upload_from_string.assert_not_called()
+
+    def test_upload_file_stream_counts_bytes(self):
+        self.enter_context(
+            absltest.mock.patch.object(data_importer, 'SINGLE_REQUEST_UPLOAD_BYTES', 20))
+        # 16 characters, but 26 bytes once encoded
+        self.import_file_mock.__iter__.return_value = import_lines(
+            [['featurestores', 'benchmark_featurestore', 'entityTypes', 'human',
+              'entities', 'bob', 'features', 'bio', 'featureDataTypes',
+              'string', 'featureValues', '\u00e9' * 10]])
+
+        tool = data_importer.DataImporter(
+            'project-id', 'region', 'featurestore.txt', 'gs://scratch_space/some/path')
+        tool.execute()
+
+        blob_mock = self.storage_mock.Client.return_value.bucket.return_value.blob.return_value
+        blob_mock.open.assert_called_once()
+        blob_mock.open.return_value.write.assert_called_once_with(
+            'bob,' + '\u00e9' * 10 + '\r\n')
+        blob_mock.upload_from_string.assert_not_called()
+
+    def test_upload_file_quoted_value(self):
+        self.import_file_mock.__iter__.return_value = import_lines(
+            [['featurestores', 'benchmark_featurestore', 'entityTypes', 'human',
+              'entities', 'bob', 'features', 'name', 'featureDataTypes',
+              'string', 'featureValues', 'Bob, Jr.'],
+            ['featurestores', 'benchmark_featurestore', 'entityTypes', 'human',
+              'entities', 'sally', 'features', 'name', '',
+              '', 'featureValues', 'Sally']])
+
+        tool = data_importer.DataImporter(
+            'project-id', 'region', 'featurestore.txt', 'gs://scratch_space/some/path')
+        tool.execute()
+
+        blob_mock = self.storage_mock.Client.return_value.bucket.return_value.blob.return_value
+        blob_mock.upload_from_string.assert_called_once_with(
+            '', content_type='text/csv')
+        self.csv_mock.writer.return_value.writerows.assert_called_once_with(
+            [('bob', 'Bob, Jr.'), ('sally', 'Sally')])
+
+    def test_parse_quoted_line(self):
+        self.csv_mock.reader.side_effect = csv.reader
+        self.import_file_mock.__iter__.return_value = iter([
+            'featurestores/benchmark_featurestore/entityTypes/human/entities/bob/'
+            'features/name/featureDataTypes/string/featureValues/"Bob\r\n',
+            'Jr/"""\r\n',
+            'featurestores/benchmark_featurestore/entityTypes/human/entities/sally/'
+            'features/name///featureValues/Sally\r\n'])
+
+        tool = data_importer.DataImporter(
+            'project-id', 'region', 'featurestore.txt', 'gs://scratch_space/some/path')
+        tool.execute()
+
+        self.csv_mock.reader.assert_called_once()
+        self.csv_mock.writer.return_value.writerows.assert_called_once_with(
+            [('bob', 'Bob\r\nJr/"'), ('sally', 'Sally')])
 
     def test_delete_blob(self):
-        self.csv_mock.reader.return_value.__iter__.return_value = iter(
+        self.import_file_mock.__iter__.return_value = import_lines(
             [['featurestores', 'benchmark_featurestore', 'entityTypes', 'human',
               'entities', 'bob', 'features', 'height', 'featureDataTypes',
               'int64', 'featureValues', '4']])
@@ -264,7 +377,7 @@ class DataImporterTest(absltest.TestCase):
         blob_mock.delete.assert_called_once()
 
     def test_delete_blob_exception(self):
-        self.csv_mock.reader.return_value.__iter__.return_value = iter(
+        self.import_file_mock.__iter__.return_value = import_lines(
             [['featurestores', 'benchmark_featurestore', 'entityTypes', 'human',
               'entities', 'bob', 'features', 'height', 'featureDataTypes',
               'int64', 'featureValues', '4']])
@@ -278,10 +391,28 @@ class DataImporterTest(absltest.TestCase):
         blob_mock = self.storage_mock.Client.return_value.bucket.return_value.blob.return_value
         blob_mock.delete.assert_called_once()
 
+    def test_create_featurestore_exception(self):
+        self.import_file_mock.__iter__.return_value = import_lines(
+            [['featurestores', 'benchmark_featurestore', 'entityTypes', 'human',
+              'entities', 'bob', 'features', 'height', 'featureDataTypes',
+              'int64', 'featureValues', '4']])
+        self.fsclient_mock.return_value.create_featurestore.side_effect = Exception('ow')
+
+        with self.assertRaises(Exception):
+            tool = data_importer.DataImporter(
+                'project-id', 'region', 'featurestore.txt', 'gs://scratch_space/some/path')
+            tool.execute()
+
+        blob_mock = self.storage_mock.Client.return_value.bucket.return_value.blob.return_value
+        blob_mock.upload_from_string.assert_called_once()
+        self.fsclient_mock.return_value.create_entity_type.assert_not_called()
+        self.fsclient_mock.return_value.import_feature_values.assert_not_called()
+        blob_mock.delete.assert_called_once()
+
     def test_ingestion_job(self):
         self.timestamp_mock.return_value.seconds = 1658265670
         self.timestamp_mock.return_value.nanos = 254864000
-        self.csv_mock.reader.return_value.__iter__.return_value = iter(
+        self.import_file_mock.__iter__.return_value = import_lines(
             [['featurestores', 'benchmark_featurestore', 'entityTypes', 'human',
               'entities', 'bob', 'features', 'height', 'featureDataTypes',
               'int64', 'featureValues', '4'],
@@ -302,23 +433,51 @@ class DataImporterTest(absltest.TestCase):
         feature_spec_mock_2.assert_any_call(id='awake')
         gcs_source_mock = self.io_pb2_mock.GcsSource
         gcs_source_mock.assert_called_with(
-            uris=['gs://scratch_space/some/path/human_d3d75.csv'])
+            uris=['gs://scratch_space/some/path/benchmark_featurestore_d3d75a/human.csv'])
         csv_source_mock = self.io_pb2_mock.CsvSource
         csv_source_mock.assert_called_with(
             gcs_source=gcs_source_mock.return_value)
         entity_type_path_mock = self.fsclient_mock.return_value.entity_type_path
         entity_type_path_mock.assert_called_with(
-            'project-id', 'region', 'benchmark_featurestore_d3d75', 'human')
+            'project-id', 'region', 'benchmark_featurestore_d3d75a', 'human')
         import_features_values_mock = self.featurestore_service_pb2_mock.ImportFeatureValuesRequest
         import_features_values_mock.assert_called_with(
             entity_type=entity_type_path_mock.return_value, csv_source=csv_source_mock.return_value,
-            disable_online_serving=True, entity_id_field='entity_id_d3d75',
+            disable_online_serving=True, entity_id_field='entity_id_d3d75a',
             feature_specs=[feature_spec_mock.return_value, feature_spec_mock_2.return_value],
             feature_time=self.timestamp_mock.return_value, worker_count=1, disable_ingestion_analysis=True)
         self.assertEqual(self.timestamp_mock.return_value.nanos % 1000000, 0)
 
+    def test_ingestion_job_multiple_entity_types(self):
+        self.import_file_mock.__iter__.return_value = import_lines(
+            [['featurestores', 'benchmark_featurestore', 'entityTypes', 'human',
+              'entities', 'bob', 'features', 'height', 'featureDataTypes',
+              'int64', 'featureValues', '4'],
+            ['featurestores', 'benchmark_featurestore', 'entityTypes', 'dog',
+              'entities', 'rex', 'features', 'awake', 'featureDataTypes',
+              'bool', 'featureValues', 'True']])
+
+        tool = data_importer.DataImporter(
+            'project-id', 'region', 'featurestore.txt', 'gs://scratch_space/some/path')
+        tool.execute()
+
+        self.entity_type_pb2_mock.EntityType.assert_called_with(description='')
+        self.assertEqual(
+            self.fsclient_mock.return_value.create_entity_type.call_count, 2)
+        self.io_pb2_mock.GcsSource.assert_has_calls(
+            [absltest.mock.call(uris=['gs://scratch_space/some/path/benchmark_featurestore_d3d75a/human.csv']),
+             absltest.mock.call(uris=['gs://scratch_space/some/path/benchmark_featurestore_d3d75a/dog.csv'])],
+            any_order=True)
+        self.assertEqual(
+            self.fsclient_mock.return_value.import_feature_values.call_count, 2)
+        blob_mock = self.storage_mock.Client.return_value.bucket.return_value.blob.return_value
+        self.assertEqual(blob_mock.delete.call_count, 2)
+        self.storage_mock.Client.assert_called_once_with('project-id')
+        self.timestamp_mock.assert_called_once()
+        self.token_hex_mock.assert_called_once()
+
     def test_failed_parsing(self):
-        self.csv_mock.reader.return_value.__iter__.return_value = iter(
+        self.import_file_mock.__iter__.return_value = import_lines(
             [['bad line']])
 
         tool = data_importer.DataImporter(
@@ -328,7 +487,7 @@ class DataImporterTest(absltest.TestCase):
         self.logging_mock.warning.assert_called_once()
 
     def test_bad_datatype(self):
-        self.csv_mock.reader.return_value.__iter__.return_value = iter(
+        self.import_file_mock.__iter__.return_value = import_lines(
             [['featurestores', 'benchmark_featurestore', 'entityTypes', 'human',
               'entities', 'bob', 'features', 'height', 'featureDataTypes',
               'int63', 'featureValues', '4']])
@@ -346,7 +505,7 @@ class DataImporterTest(absltest.TestCase):
             tool.execute()
 
     def test_array_not_implemented(self):
-        self.csv_mock.reader.return_value.__iter__.return_value = iter(
+        self.import_file_mock.__iter__.return_value = import_lines(
             [['featurestores', 'benchmark_featurestore', 'entityTypes', 'human',
               'entities', 'bob', 'features', 'height', 'featureDataTypes',
               'int64_array', 'featureValues', '1,2,3']])
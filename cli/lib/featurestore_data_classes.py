@@ -14,35 +14,25 @@
 
 from collections import defaultdict
 from dataclasses import dataclass, field
-from typing import Any, DefaultDict
+from typing import Any, DefaultDict, Dict, List
 
 from google.cloud.aiplatform_v1.types import feature as feature_pb2
 
-@dataclass()
+@dataclass(slots=True)
 class FeatureMetadata:
     data_type: feature_pb2.Feature.ValueType = feature_pb2.Feature.ValueType.VALUE_TYPE_UNSPECIFIED
 
 
-@dataclass()
-class Feature:
-    value: Any = ''
-
-
-@dataclass()
-class Entity:
-    features: DefaultDict[str, Feature] = field(
-        default_factory=lambda: defaultdict(Feature))
-
-
-@dataclass
+@dataclass(slots=True)
 class EntityType:
     features_metadata: DefaultDict[str, FeatureMetadata] = field(
         default_factory=lambda: defaultdict(FeatureMetadata))
-    entities: DefaultDict[str, Entity] = field(
-        default_factory=lambda: defaultdict(Entity))
+    # Columnar entity data: columns[feature_id][i] is the value for entity_ids[i]
+    entity_ids: List[str] = field(default_factory=list)
+    columns: Dict[str, List[Any]] = field(default_factory=dict)
 
 
-@dataclass
+@dataclass(slots=True)
 class Featurestore:
     entity_types: DefaultDict[str, EntityType] = field(
         default_factory=lambda: defaultdict(EntityType))
@@ -13,23 +13,33 @@
 # limitations under the License.
 
 import base64
+from concurrent.futures import ThreadPoolExecutor
 import dataclasses
+from http import HTTPStatus
+from math import ceil
 import os
 from pathlib import Path
-import subprocess
-from tempfile import mkstemp
-from time import sleep
+import re
+from time import monotonic, sleep
 from typing import Any
 from uuid import uuid4
 
 from absl import logging
 from googleapiclient.discovery import build
+from google import auth
+from google.auth.transport.requests import Request
 from google.cloud import bigquery
-from google.cloud.exceptions import NotFound
-from kubernetes import client, config, utils
+from kubernetes import client, utils, watch
+from kubernetes.client.rest import ApiException
+import yaml
 
 WAIT_TIME_PER_ITERATION_SECONDS = 15
+INITIAL_WAIT_TIME_SECONDS = 1
+WAIT_TIME_BACKOFF_MULTIPLIER = 1.7
 MAX_WAIT_TIME_SECONDS = 1800  # 30 minutes
+TEMPLATE_PLACEHOLDER_PATTERN = re.compile(r'<<(\w+)>>')
+# Multiple of 3 so that each chunk encodes to base64 without padding
+BASE64_READ_CHUNK_SIZE = 3 * 1024 * 1024
 
 
 @dataclasses.dataclass
@@ -90,11 +100,10 @@ class FrameworkRunner:
       cluster_name = self._create_cluster(cluster_parent, gke_client)
 
     try:
-      self._load_credentials(cluster_name)
-      jobs = self._create_jobs()
-
-      for job_name in jobs:
-        self._wait_for_job_to_complete(job_name)
+      self._load_credentials(gke_client, cluster_parent, cluster_name)
+      run_name = f'fsloadtest-{str(uuid4())[:5]}'
+      jobs = self._create_jobs(run_name)
+      self._wait_for_jobs_to_complete(run_name, jobs)
     finally:
       # Don't delete the cluster if the user wants to keep it
       # or the cluster was user supplied
@@ -107,49 +116,78 @@ class FrameworkRunner:
     client = bigquery.Client()
     dataset_id = f'{self._project_id}.vertex_ai_benchmarker_results_{self._target_qps}_qps_{str(uuid4())[:5]}'
 
-    # Check if dataset exists. If not, create a new one.
-    try:
-        dataset = client.get_dataset(dataset_id)  # Make an API request.
-    except NotFound:
-        # Construct a full Dataset object to send to the API.
-        dataset = bigquery.Dataset(dataset_id)
-        dataset.location = self._region
+    # Construct a full Dataset object to send to the API.
+    dataset = bigquery.Dataset(dataset_id)
+    dataset.location = self._region
 
-        # Send the dataset to the API for creation, with an explicit timeout.
-        # Raises google.api_core.exceptions.Conflict if the Dataset already
-        # exists within the project.
-        dataset = client.create_dataset(dataset, timeout=30)  # Make an API request.
+    # Create the dataset if it doesn't exist yet in a single request, with an
+    # explicit timeout.
+    client.create_dataset(dataset, exists_ok=True, timeout=30)
 
     return dataset_id
 
-  def _create_jobs(self):
+  def _create_jobs(self, run_name: str):
     """Create the jobs to run on GKE.
 
+        Args:
+            run_name: Name of the run the jobs belong to.
+
         Returns:
             List of the names of the jobs.
     """
-    jobs = []
     # If the target QPS is evenly divisible by the cluster size, only one job is needed.
     # Otherwise create a second job for only the last pod and put the remainder QPS in there.
     if self._target_qps % self._cluster_size == 0:
-      job_name = self._create_job(self._cluster_size,
-                                  self._target_qps // self._cluster_size)
-      jobs.append(job_name)
+      job_specs = [(self._cluster_size, self._target_qps // self._cluster_size)]
     else:
       primary_job_qps = self._target_qps // self._cluster_size
-      primary_job_name = self._create_job(self._cluster_size - 1,
-                                          primary_job_qps)
-      jobs.append(primary_job_name)
-
       secondary_job_qps = primary_job_qps + self._target_qps % self._cluster_size
-      secondary_job_name = self._create_job(1, secondary_job_qps)
-      jobs.append(secondary_job_name)
-    return jobs
+      job_specs = [(self._cluster_size - 1, primary_job_qps),
+                   (1, secondary_job_qps)]
+
+    self._create_config_map(run_name)
+    run_template = self._render_run_template(run_name)
+
+    # Creating a job is a round trip to the cluster, so create them concurrently
+    with ThreadPoolExecutor(max_workers=len(job_specs)) as executor:
+      job_futures = [
+          executor.submit(self._create_job, run_template, pods, target_qps)
+          for pods, target_qps in job_specs
+      ]
+      return [job_future.result() for job_future in job_futures]
+
+  def _create_config_map(self, run_name: str):
+    """Create the ConfigMap holding the files shared by all jobs of a run.
+
+        Args:
+            run_name: Name of the run the jobs belong to.
+    """
+    config_map_name = f'{run_name}-config-files'
+    logging.info(f'Creating config map `{config_map_name}`...')
+
+    feature_query_file_path = self._feature_query_file_path
+    if feature_query_file_path.startswith('gs://'):
+      # Example file provided for debugging purposes
+      feature_query_file_path = 'data/query_file.textproto'
+
+    entity_file_path = self._entity_file_path
+    if entity_file_path.startswith('gs://'):
+      # Example file provided for debugging purposes
+      entity_file_path = 'data/entity_file.txt'
+
+    config_map = client.V1ConfigMap(
+        metadata=client.V1ObjectMeta(name=config_map_name),
+        binary_data={
+            'feature_query_file': _base64_content(feature_query_file_path),
+            'entity_file': _base64_content(entity_file_path),
+        })
+    client.CoreV1Api().create_namespaced_config_map('default', config_map)
 
-  def _create_job(self, pods: int, target_qps: int):
+  def _create_job(self, run_template: str, pods: int, target_qps: int):
     """Create a job to run on GKE.
 
         Args:
+            run_template: Job template with the run wide flags filled out.
             pods: Number of pods to assign job to.
             target_qps: Targetted queries per second.
 
@@ -159,43 +197,94 @@ class FrameworkRunner:
     job_name = f'fsloadtest-{str(uuid4())[:5]}-job'
     logging.info(f'Creating job `{job_name}`...')
 
-    temp_filepath = self._write_job_file(job_name, pods, target_qps)
+    job_file_content = self._render_job_file(run_template, job_name, pods,
+                                             target_qps)
 
-    try:
-      kubernetes_client = client.ApiClient()
-      utils.create_from_yaml(kubernetes_client, temp_filepath)
-    finally:
-      os.remove(temp_filepath)
+    kubernetes_client = client.ApiClient()
+    utils.create_from_yaml(
+        kubernetes_client,
+        yaml_objects=list(yaml.safe_load_all(job_file_content)))
     return job_name
 
-  def _load_credentials(self, cluster_name: str):
+  def _load_credentials(self, gke_client: Any, cluster_parent: str,
+                        cluster_name: str):
     """Load the credentials for a GKE cluster.
 
         Args:
+            gke_client: GKE client.
+            cluster_parent: Parent path of cluster.
             cluster_name: Name of the GKE cluster.
     """
-    subprocess.run([
-        'gcloud', 'container', 'clusters', 'get-credentials', cluster_name,
-        f'--project={self._project_id}', f'--zone={self._cluster_zone}'
-    ],
-                   check=True)
-    config.load_kube_config()
-
-  def _wait_for_job_to_complete(self, job_name: str):
-    """Wait for a job to complete on GKE.
+    cluster = gke_client.projects().locations().clusters().get(
+        name=f'{cluster_parent}/clusters/{cluster_name}').execute()
+
+    credentials, _ = auth.default(
+        scopes=['https://www.googleapis.com/auth/cloud-platform'])
+    credentials.refresh(Request())
+
+    def refresh_token(configuration: client.Configuration):
+      # Access tokens expire, so refresh them for long running jobs
+      if not credentials.valid:
+        credentials.refresh(Request())
+        configuration.api_key['BearerToken'] = credentials.token
+
+    configuration = client.Configuration(
+        host=f"https://{cluster['endpoint']}",
+        api_key={'BearerToken': credentials.token},
+        api_key_prefix={'BearerToken': 'Bearer'},
+        ca_cert_data=base64.b64decode(
+            cluster['masterAuth']['clusterCaCertificate']).decode('ascii'))
+    configuration.refresh_api_key_hook = refresh_token
+    client.Configuration.set_default(configuration)
+
+  def _wait_for_jobs_to_complete(self, run_name: str, job_names: list[str]):
+    """Wait for the jobs of a run to complete on GKE.
 
         Args:
-            job_name: Name of the job to wait for.
+            run_name: Name of the run the jobs belong to.
+            job_names: Names of the jobs to wait for.
+
+        Raises:
+            Exception if the maximum amount of wait time is exceeded.
     """
-    logging.info(f'Waiting for job to complete...')
+    logging.info(f'Waiting for jobs to complete...')
     batch_api = client.BatchV1Api()
-    job_status = batch_api.read_namespaced_job_status(job_name, 'default')
-    current_wait = 0
-    while job_status.status.failed is None and job_status.status.succeeded is None:
-      current_wait = self._sleep_with_timeout(current_wait)
-      job_status = batch_api.read_namespaced_job_status(job_name, 'default')
-
-    logging.info(f'Job completed with status `{job_status.status}`.')
+    pending_jobs = set(job_names)
+    job_watch = watch.Watch()
+    deadline = monotonic() + MAX_WAIT_TIME_SECONDS
+    resource_version = None
+    # A single watch follows every job of the run. Its stream ends once the
+    # server side timeout elapses, but the connection can also be closed
+    # early, so it's re-opened, resuming from the last version seen, until the
+    # deadline has actually passed.
+    while (remaining_wait := deadline - monotonic()) > 0:
+      try:
+        for event in job_watch.stream(
+            batch_api.list_namespaced_job,
+            namespace='default',
+            label_selector=f'fsloadtest-run={run_name}',
+            resource_version=resource_version,
+            timeout_seconds=ceil(remaining_wait)):
+          job = event['object']
+          resource_version = job.metadata.resource_version
+          job_status = job.status
+          if job.metadata.name in pending_jobs and (
+              job_status.failed is not None or
+              job_status.succeeded is not None):
+            pending_jobs.remove(job.metadata.name)
+            logging.info(f'Job `{job.metadata.name}` completed with status '
+                         f'`{job_status}`.')
+            if not pending_jobs:
+              job_watch.stop()
+              return
+      except ApiException as e:
+        if e.status != HTTPStatus.GONE:
+          raise
+        # The version is too old to resume from, so start again from the
+        # jobs' current state
+        resource_version = None
+
+    raise Exception('Maximum wait time exceeded')
 
   def _delete_cluster(self, gke_client: Any, parent: str, cluster_name: str):
     """Delete a cluster on GKE.
@@ -213,23 +302,17 @@ class FrameworkRunner:
 
     self._wait_for_operation(gke_client, parent, delete_operation)
 
-  def _write_job_file(self, job_name: str, pods: int, target_qps: int) -> str:
-    """Write job file to be uploaded to GKE.
+  def _render_run_template(self, run_name: str) -> str:
+    """Render the flags shared by all jobs of a run into the job template.
 
         Args:
-            job_name: Name of the job.
-            pods: Number of pods to assign job to.
-            target_qps: Targetted queries per second.
+            run_name: Name of the run the jobs belong to.
 
         Returns:
-            Path to the job file.
+            Job template with only the per job placeholders left to fill out.
     """
-    # Create a file in temporary space
-    temp_file_handle, temp_filepath = mkstemp(text=True)
-
-    job_flags = {
-        'job_name': job_name,
-        'pods': str(pods),
+    run_flags = {
+        'run_name': run_name,
         'image_url': self._image_url,
         'project_id': self._project_id,
     }
@@ -238,13 +321,9 @@ class FrameworkRunner:
 
     if feature_query_file_path.startswith('gs://'):
       # Example file provided for debugging purposes
-      job_flags['feature_query_file_path'] = 'example_query_file.textproto'
-      job_flags['feature_query_file_content'] = _base64_content(
-          'data/query_file.textproto')
+      run_flags['feature_query_file_path'] = 'example_query_file.textproto'
     else:
-      job_flags['feature_query_file_path'] = feature_query_file_path.lstrip('/')
-      job_flags['feature_query_file_content'] = _base64_content(
-          feature_query_file_path)
+      run_flags['feature_query_file_path'] = feature_query_file_path.lstrip('/')
       feature_query_file_path = os.path.join(
           '/config',
           feature_query_file_path.lstrip('/'),
@@ -254,16 +333,15 @@ class FrameworkRunner:
 
     if entity_file_path.startswith('gs://'):
       # Example file provided for debugging purposes
-      job_flags['entity_file_path'] = 'example_entity_file.txt'
-      job_flags['entity_file_content'] = _base64_content('data/entity_file.txt')
+      run_flags['entity_file_path'] = 'example_entity_file.txt'
     else:
-      job_flags['entity_file_path'] = entity_file_path.lstrip('/')
-      job_flags['entity_file_content'] = _base64_content(entity_file_path)
+      run_flags['entity_file_path'] = entity_file_path.lstrip('/')
       entity_file_path = os.path.join('/config', entity_file_path.lstrip('/'))
 
-    # Determine the values for the job template
-    job_flags['args']= (
-       f'--target_qps={str(target_qps)} ' \
+    # Determine the values for the job template, leaving the target QPS to be
+    # filled out per job
+    run_flags['args']= (
+       f'--target_qps=<<target_qps>> ' \
        f'--num_threads={str(self._num_threads)} ' \
        f'--sample_strategy={self._sample_strategy} ' \
        f'--num_samples={str(self._num_samples)} ' \
@@ -276,17 +354,28 @@ class FrameworkRunner:
        f'--bigquery_output_dataset={self._dataset_id}'
     )
 
-    # Copy the template while filling out the flags
     with open('data/job_template.yaml', 'r') as template_file:
-      with os.fdopen(temp_file_handle, 'w') as temp_file:
-        while template_line := template_file.readline():
-          for keyword, replacement in job_flags.items():
-            replace_keyword = f'<<{keyword}>>'
-            template_line = template_line.replace(replace_keyword, replacement)
-          temp_file.write(template_line)
-        temp_file.flush()
+      return _fill_template(template_file.read(), run_flags)
+
+  def _render_job_file(self, run_template: str, job_name: str, pods: int,
+                       target_qps: int) -> str:
+    """Render job file to be uploaded to GKE.
+
+        Args:
+            run_template: Job template with the run wide flags filled out.
+            job_name: Name of the job.
+            pods: Number of pods to assign job to.
+            target_qps: Targetted queries per second.
 
-    return temp_filepath
+        Returns:
+            Content of the job file.
+    """
+    job_flags = {
+        'job_name': job_name,
+        'pods': str(pods),
+        'target_qps': str(target_qps),
+    }
+    return _fill_template(run_template, job_flags)
 
   def _create_cluster(self, cluster_parent: str, gke_client: Any):
     """Create a cluster on GKE.
@@ -341,15 +430,26 @@ class FrameworkRunner:
     operation_name = f"{cluster_parent}/operations/{operation['name']}"
     operation_status = operation['status']
     current_wait = 0
+    # Back off from a short interval so quick operations return promptly while
+    # long running ones are still polled at most every
+    # WAIT_TIME_PER_ITERATION_SECONDS.
+    interval = INITIAL_WAIT_TIME_SECONDS
     while operation_status != 'DONE':
-      current_wait = self._sleep_with_timeout(current_wait)
+      current_wait = self._sleep_with_timeout(current_wait, interval)
+      interval = min(interval * WAIT_TIME_BACKOFF_MULTIPLIER,
+                     WAIT_TIME_PER_ITERATION_SECONDS)
       operation_status = gke_client.projects().locations().operations().get(
           name=operation_name).execute()['status']
 
-  def _sleep_with_timeout(self, current_wait: int) -> int:
+  def _sleep_with_timeout(
+      self,
+      current_wait: float,
+      interval: float = WAIT_TIME_PER_ITERATION_SECONDS) -> float:
     """Sleep with a timeout to prevent getting permanently stuck.
 
-        Args: Current amount of time spent sleeping.
+        Args:
+            current_wait: Current amount of time spent sleeping.
+            interval: Amount of time to sleep for.
 
         Returns:
             End amount of time spent sleeping.
@@ -357,13 +457,24 @@ class FrameworkRunner:
         Raises:
             Exception if the maximum amount of wait time is exceeded.
     """
-    sleep(WAIT_TIME_PER_ITERATION_SECONDS)
-    current_wait += WAIT_TIME_PER_ITERATION_SECONDS
+    sleep(interval)
+    current_wait += interval
     if current_wait > MAX_WAIT_TIME_SECONDS:
       raise Exception('Maximum wait time exceeded')
     return current_wait
 
 
+def _fill_template(template: str, flags: dict[str, str]) -> str:
+  # Fill out the flags in a single pass over the template, leaving unknown
+  # placeholders untouched
+  return TEMPLATE_PLACEHOLDER_PATTERN.sub(
+      lambda match: flags.get(match[1], match[0]), template)
+
+
 def _base64_content(path: str) -> str:
-  base64_bytes = Path(path).read_text().encode('ascii')
-  return base64.b64encode(base64_bytes).decode('ascii')
+  # Encode the file chunk by chunk rather than holding it in memory whole
+  base64_bytes = bytearray()
+  with Path(path).open('rb') as file:
+    while chunk := file.read(BASE64_READ_CHUNK_SIZE):
+      base64_bytes += base64.b64encode(chunk)
+  return base64_bytes.decode('ascii')
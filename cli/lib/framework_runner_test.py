@@ -13,123 +13,161 @@
 # limitations under the License.
 """Tests for framework_runner."""
 
-import os
+from types import SimpleNamespace
 
 from absl.testing import absltest
-from google.cloud.exceptions import NotFound
+from absl.testing import parameterized
+from kubernetes.client.rest import ApiException
 import lib.framework_runner as framework_runner
 
-
-class FrameworkRunnerTest(absltest.TestCase):
+# Base64 encoded contents of data/query_file.textproto
+_QUERY_FILE_BASE64 = (
+    'IyBwcm90by1maWxlOiBmZWF0dXJlc3RvcmVfb25saW5lX3NlcnZpY2UucHJvdG8KIyBwcm90'
+    'by1tZXNzYWdlOiBSZXF1ZXN0cwoKcmVxdWVzdHNfcGVyX2ZlYXR1cmVzdG9yZTogewogIGZl'
+    'YXR1cmVzdG9yZV9pZDogImJlbmNobWFya19mZWF0dXJlc3RvcmVfYWJjMTIzIgogIHJlcXVl'
+    'c3RzOiB7CiAgICByZWFkX2ZlYXR1cmVfdmFsdWVzX3JlcXVlc3Q6IHsKICAgICAgZW50aXR5'
+    'X3R5cGU6ICJodW1hbiIKICAgICAgZW50aXR5X2lkOiAiJHtFTlRJVFlfSUR9IgogICAgICBm'
+    'ZWF0dXJlX3NlbGVjdG9yOiB7CiAgICAgICAgaWRfbWF0Y2hlcjogewogICAgICAgICAgaWRz'
+    'OiBbIioiXQogICAgICAgIH0KICAgICAgfQogICAgfQogIH0KfQo=')
+# Base64 encoded contents of data/entity_file.txt
+_ENTITY_FILE_BASE64 = (
+    'ZmVhdHVyZXN0b3Jlcy9iZW5jaG1hcmtfZmVhdHVyZXN0b3JlX2FiYzEyMy9lbnRpdHlUeXBl'
+    'cy9odW1hbi9lbnRpdHkvdXNlcl9hQGdtYWlsLmNvbQpmZWF0dXJlc3RvcmVzL2JlbmNobWFy'
+    'a19mZWF0dXJlc3RvcmVfYWJjMTIzL2VudGl0eVR5cGVzL2h1bWFuL2VudGl0eS91c2VyX2JA'
+    'Z21haWwuY29tCmZlYXR1cmVzdG9yZXMvYmVuY2htYXJrX2ZlYXR1cmVzdG9yZV9hYmMxMjMv'
+    'ZW50aXR5VHlwZXMvaHVtYW4vZW50aXR5L3VzZXJfY0BnbWFpbC5jb20K')
+
+# Node pool clusters are created with by default
+_NODE_POOL = {
+    'name': 'read-storage',
+    'initialNodeCount': 5,
+    'config': {
+        'oauthScopes': ['https://www.googleapis.com/auth/cloud-platform']
+    }
+}
+
+
+class FrameworkRunnerTest(parameterized.TestCase):
 
   _DEFAULT_PROJ = 'project'
 
+  @classmethod
+  def setUpClass(cls):
+    super().setUpClass()
+
+    # Patch once per class and only reset the mocks between tests
+    cls._class_mocks = {
+        # Open is a native method that can't be autospec'ed
+        'open_mock': cls._patch('open'),
+        'uuid_mock': cls._patch('uuid4', autospec=True),
+        'sleep_mock': cls._patch('sleep', autospec=True),
+        'monotonic_mock': cls._patch('monotonic', autospec=True),
+        'auth_mock': cls._patch('auth', autospec=True),
+        'request_mock': cls._patch('Request', autospec=True),
+        'logging_mock': cls._patch('logging', autospec=True),
+        'build_mock': cls._patch('build', autospec=True),
+        # Specing the Kubernetes client module imports every one of its
+        # models, which takes seconds, so leave it unspecced
+        'client_mock': cls._patch('client'),
+        'watch_mock': cls._patch('watch', autospec=True),
+        'utils_mock': cls._patch('utils', autospec=True),
+        'bq_mock': cls._patch('bigquery', autospec=True),
+    }
+
+  @classmethod
+  def _patch(cls, attribute: str, **kwargs):
+    patcher = absltest.mock.patch.object(framework_runner, attribute, **kwargs)
+    cls.addClassCleanup(patcher.stop)
+    return patcher.start()
+
   def setUp(self):
     super().setUp()
 
-    # Open is a native method that can't be autospec'ed
-    self.open_mock = self.enter_context(
-        absltest.mock.patch.object(framework_runner, 'open'))
-    self.open_mock.return_value.__enter__().readline.return_value = ''
-
-    self.fdopen_mock = self.enter_context(
-        absltest.mock.patch.object(os, 'fdopen', autospec=True))
-    self.fdopen_text = ''
-    self.fdopen_mock.return_value.__enter__(
-    ).write.side_effect = self.append_fdopen_text
-
-    self.remove_mock = self.enter_context(
-        absltest.mock.patch.object(os, 'remove', autospec=True))
-
-    self.mkstemp_mock = self.enter_context(
-        absltest.mock.patch.object(framework_runner, 'mkstemp', autospec=True))
-    self.mkstemp_mock.return_value = 0, '/temp'
-
-    uuid_mock = self.enter_context(
-        absltest.mock.patch.object(framework_runner, 'uuid4', autospec=True))
-    uuid_mock.return_value = 'd3d75afa-a029-4842-9b77-f753661dd1f5'
-
-    self.sleep_mock = self.enter_context(
-        absltest.mock.patch.object(framework_runner, 'sleep', autospec=True))
-    self.subprocess_mock = self.enter_context(
-        absltest.mock.patch.object(
-            framework_runner, 'subprocess', autospec=True))
-
-    self.enter_context(
-        absltest.mock.patch.object(framework_runner, 'logging', autospec=True))
-
-    self.build_mock = self.enter_context(
-        absltest.mock.patch.object(framework_runner, 'build', autospec=True))
-    self.build_mock.return_value.projects().locations().clusters().create(
-    ).execute(
-    ).__getitem__.side_effect = lambda x: 'create-operation' if x == 'name' else 'DONE'
-    self.build_mock.return_value.projects().locations().clusters().delete(
-    ).execute(
-    ).__getitem__.side_effect = lambda x: 'delete-operation' if x == 'name' else 'DONE'
-    self.build_mock.return_value.projects().locations().operations().get(
-    ).execute().__getitem__.return_value = 'DONE'
-
-    self.client_mock = self.enter_context(
-        absltest.mock.patch.object(framework_runner, 'client', autospec=True))
-    self.job_status_mock = absltest.mock.MagicMock()
-    self.job_status_mock.status.succeeded = False
-    self.job_status_mock.status.failed = True
-    self.client_mock.BatchV1Api.return_value.read_namespaced_job_status.return_value = self.job_status_mock
-
-    self.config_mock = self.enter_context(
-        absltest.mock.patch.object(framework_runner, 'config', autospec=True))
-    self.utils_mock = self.enter_context(
-        absltest.mock.patch.object(framework_runner, 'utils', autospec=True))
-
-    self.bq_client_mock = absltest.mock.MagicMock()
-    self.bq_client_mock.get_dataset.side_effect = NotFound('dataset not found')
-    self.bq_client_mock.create_dataset.return_value = absltest.mock.MagicMock()
-    self.bq_mock = self.enter_context(
-        absltest.mock.patch.object(framework_runner, 'bigquery', autospec=True))
-    self.bq_mock.Client.return_value = self.bq_client_mock
-    self.dataset_mock = absltest.mock.MagicMock()
-    self.bq_mock.Dataset.return_value = self.dataset_mock
-
-  def _minimal_initialization(self) -> framework_runner.FrameworkRunner:
-    return framework_runner.FrameworkRunner(
-        _project_id=self._DEFAULT_PROJ,
-        _region='region',
-        _target_qps=5,
-        _num_threads=2,
-        _sample_strategy='strategy',
-        _num_warmup_samples=5,
-        _num_samples=10,
-        _gcs_log_path='',
-        _cluster_zone='zone',
-        _cluster_size=5,
-        _existing_cluster_name='',
-        _keep_cluster=False,
-        _service_account='',
-        _feature_query_file_path='data/query_file.textproto',
-        _entity_file_path='data/entity_file.txt',
-        _image_url='image-url')
-
-  def append_fdopen_text(self, text: str):
-    self.fdopen_text += text
+    for name, mock in self._class_mocks.items():
+      mock.reset_mock()
+      setattr(self, name, mock)
+
+    self.open_mock.return_value.__enter__().read.return_value = ''
+
+    self.uuid_mock.side_effect = None
+    self.uuid_mock.return_value = 'd3d75afa-a029-4842-9b77-f753661dd1f5'
+
+    self.monotonic_mock.side_effect = None
+    self.monotonic_mock.return_value = 0
+
+    self.credentials_mock = absltest.mock.MagicMock()
+    self.credentials_mock.token = 'token'
+    self.auth_mock.default.side_effect = None
+    self.auth_mock.default.return_value = self.credentials_mock, 'project'
+
+    # Keep references to the nodes of the GKE client chain rather than calling
+    # through it, which would record calls on every lookup
+    projects_mock = self.build_mock.return_value.projects.return_value
+    locations_mock = projects_mock.locations.return_value
+    self.clusters_mock = locations_mock.clusters.return_value
+    self.operations_mock = locations_mock.operations.return_value
+    self.create_operation_mock = (
+        self.clusters_mock.create.return_value.execute.return_value)
+    self.delete_operation_mock = (
+        self.clusters_mock.delete.return_value.execute.return_value)
+    self.operation_status_mock = (
+        self.operations_mock.get.return_value.execute.return_value)
+    self.create_operation_mock.__getitem__.side_effect = {
+        'name': 'create-operation',
+        'status': 'DONE'
+    }.__getitem__
+    self.delete_operation_mock.__getitem__.side_effect = {
+        'name': 'delete-operation',
+        'status': 'DONE'
+    }.__getitem__
+    self.operation_status_mock.__getitem__.side_effect = None
+    self.operation_status_mock.__getitem__.return_value = 'DONE'
+    self.clusters_mock.get.return_value.execute.return_value = {
+        'endpoint': '127.0.0.1',
+        'masterAuth': {
+            'clusterCaCertificate': 'Y2EtY2VydA=='
+        }
+    }
+
+    self.batch_api_mock = self.client_mock.BatchV1Api.return_value
+    self.job_status_mock = SimpleNamespace(
+        metadata=SimpleNamespace(
+            name='fsloadtest-d3d75-job', resource_version='1'),
+        status=SimpleNamespace(succeeded=False, failed=True))
+    self.watch_mock.Watch.return_value.stream.side_effect = lambda *args, **kwargs: iter(
+        [{
+            'object': self.job_status_mock
+        }])
+
+    # Reuse the class wide mocks, which were reset above, rather than
+    # allocating new ones for every test
+    self.bq_client_mock = self.bq_mock.Client.return_value
+    self.dataset_mock = self.bq_mock.Dataset.return_value
+
+  def _minimal_initialization(self,
+                              **overrides) -> framework_runner.FrameworkRunner:
+    return framework_runner.FrameworkRunner(**{
+        '_project_id': self._DEFAULT_PROJ,
+        '_region': 'region',
+        '_target_qps': 5,
+        '_num_threads': 2,
+        '_sample_strategy': 'strategy',
+        '_num_warmup_samples': 5,
+        '_num_samples': 10,
+        '_gcs_log_path': '',
+        '_cluster_zone': 'zone',
+        '_cluster_size': 5,
+        '_existing_cluster_name': '',
+        '_keep_cluster': False,
+        '_service_account': '',
+        '_feature_query_file_path': 'data/query_file.textproto',
+        '_entity_file_path': 'data/entity_file.txt',
+        '_image_url': 'image-url',
+        **overrides,
+    })
 
   def test_target_qps_too_low_exception(self):
-    tool = framework_runner.FrameworkRunner(
-        _project_id=self._DEFAULT_PROJ,
-        _region='region',
-        _target_qps=2,
-        _num_threads=2,
-        _sample_strategy='strategy',
-        _num_warmup_samples=5,
-        _num_samples=10,
-        _gcs_log_path='',
-        _cluster_zone='zone',
-        _cluster_size=5,
-        _existing_cluster_name='',
-        _keep_cluster=False,
-        _service_account='',
-        _feature_query_file_path='data/query_file.textproto',
-        _entity_file_path='data/entity_file.txt',
-        _image_url='image-url')
+    tool = self._minimal_initialization(_target_qps=2)
     with self.assertRaises(Exception):
       tool.execute()
 
@@ -143,13 +181,13 @@ class FrameworkRunnerTest(absltest.TestCase):
     tool = self._minimal_initialization()
     tool.execute()
 
-    self.bq_mock.Client.assert_called_with()
-    self.bq_client_mock.get_dataset.assert_called_with(
-        'project.vertex_ai_benchmarker_results_5_qps_d3d75')
-    self.bq_mock.Dataset.assert_called_with(
-        'project.vertex_ai_benchmarker_results_5_qps_d3d75')
-    self.bq_client_mock.create_dataset.assert_called_with(
-        self.dataset_mock, timeout=30)
+    self.assertEqual([
+        absltest.mock.call.Client(),
+        absltest.mock.call.Dataset(
+            'project.vertex_ai_benchmarker_results_5_qps_d3d75'),
+        absltest.mock.call.Client().create_dataset(
+            self.dataset_mock, exists_ok=True, timeout=30),
+    ], self.bq_mock.mock_calls)
 
   def test_kubernetes_client(self):
     tool = self._minimal_initialization()
@@ -167,326 +205,221 @@ class FrameworkRunnerTest(absltest.TestCase):
     tool = self._minimal_initialization()
     tool.execute()
 
-    node_pool = [{
-        'name': 'read-storage',
-        'initialNodeCount': 5,
-        'config': {
-            'oauthScopes': ['https://www.googleapis.com/auth/cloud-platform']
-        }
-    }]
-    self.build_mock.return_value.projects().locations().clusters(
-    ).create.assert_called_with(
-        parent='projects/project/locations/zone',
-        body={
-            'parent': 'projects/project/locations/zone',
-            'cluster': {
-                'name': 'fsloadtest-d3d75-cluster',
-                'nodePools': node_pool
-            }
-        })
-    self.build_mock.return_value.projects().locations().clusters().create(
-    ).execute.assert_called()
+    node_pool = [_NODE_POOL]
+    self.clusters_mock.assert_has_calls([
+        absltest.mock.call.create(
+            parent='projects/project/locations/zone',
+            body={
+                'parent': 'projects/project/locations/zone',
+                'cluster': {
+                    'name': 'fsloadtest-d3d75-cluster',
+                    'nodePools': node_pool
+                }
+            }),
+        absltest.mock.call.create().execute(),
+    ])
 
   def test_create_cluster_with_service_account(self):
-    tool = framework_runner.FrameworkRunner(
-        _project_id=self._DEFAULT_PROJ,
-        _region='region',
-        _target_qps=5,
-        _num_threads=2,
-        _sample_strategy='strategy',
-        _num_warmup_samples=5,
-        _num_samples=10,
-        _gcs_log_path='',
-        _cluster_zone='zone',
-        _cluster_size=5,
-        _existing_cluster_name='',
-        _keep_cluster=False,
-        _service_account='service-account',
-        _feature_query_file_path='data/query_file.textproto',
-        _entity_file_path='data/entity_file.txt',
-        _image_url='image-url')
+    tool = self._minimal_initialization(_service_account='service-account')
     tool.execute()
 
     node_pool = [{
-        'name': 'read-storage',
-        'initialNodeCount': 5,
-        'config': {
-            'oauthScopes': ['https://www.googleapis.com/auth/cloud-platform'],
-            'serviceAccount': 'service-account'
+        **_NODE_POOL, 'config': {
+            **_NODE_POOL['config'], 'serviceAccount': 'service-account'
         }
     }]
-    self.build_mock.return_value.projects().locations().clusters(
-    ).create.assert_called_with(
-        parent='projects/project/locations/zone',
-        body={
-            'parent': 'projects/project/locations/zone',
-            'cluster': {
-                'name': 'fsloadtest-d3d75-cluster',
-                'nodePools': node_pool
-            }
-        })
-    self.build_mock.return_value.projects().locations().clusters().create(
-    ).execute.assert_called()
-
-  def test_wait_for_cluster_creation(self):
-    self.build_mock.return_value.projects().locations().clusters().create(
-    ).execute(
-    ).__getitem__.side_effect = lambda x: 'create-operation' if x == 'name' else 'IN PROGRESS'
-    self.build_mock.return_value.projects().locations().operations().get(
-    ).execute().__getitem__.side_effect = ['IN PROGRESS', 'DONE']
+    self.clusters_mock.assert_has_calls([
+        absltest.mock.call.create(
+            parent='projects/project/locations/zone',
+            body={
+                'parent': 'projects/project/locations/zone',
+                'cluster': {
+                    'name': 'fsloadtest-d3d75-cluster',
+                    'nodePools': node_pool
+                }
+            }),
+        absltest.mock.call.create().execute(),
+    ])
+
+  @parameterized.parameters('create', 'delete')
+  def test_wait_for_cluster_operation(self, operation: str):
+    getattr(self, f'{operation}_operation_mock').__getitem__.side_effect = {
+        'name': f'{operation}-operation',
+        'status': 'IN PROGRESS'
+    }.__getitem__
+    self.operation_status_mock.__getitem__.side_effect = ['IN PROGRESS', 'DONE']
 
     tool = self._minimal_initialization()
     tool.execute()
 
-    self.build_mock.return_value.projects().locations().operations(
-    ).get.assert_any_call(
-        name='projects/project/locations/zone/operations/create-operation')
-    self.build_mock.return_value.projects().locations().operations().get(
-    ).execute().__getitem__.assert_called()
+    self.operations_mock.get.assert_any_call(
+        name=('projects/project/locations/zone/operations/'
+              f'{operation}-operation'))
+    self.operation_status_mock.__getitem__.assert_called()
     self.sleep_mock.assert_has_calls(
-        [absltest.mock.call(15), absltest.mock.call(15)])
-
-  def test_wait_for_cluster_creation_timeout(self):
-    self.build_mock.return_value.projects().locations().clusters().create(
-    ).execute(
-    ).__getitem__.side_effect = lambda x: 'create-operation' if x == 'name' else 'IN PROGRESS'
-    self.build_mock.return_value.projects().locations().operations().get(
-    ).execute().__getitem__.return_value = 'IN PROGRESS'
+        [absltest.mock.call(1), absltest.mock.call(1.7)])
+
+  @parameterized.parameters('create', 'delete')
+  def test_wait_for_cluster_operation_timeout(self, operation: str):
+    getattr(self, f'{operation}_operation_mock').__getitem__.side_effect = {
+        'name': f'{operation}-operation',
+        'status': 'IN PROGRESS'
+    }.__getitem__
+    self.operation_status_mock.__getitem__.return_value = 'IN PROGRESS'
+    # Time out after a couple of polls rather than polling for the full wait
+    self.enter_context(
+        absltest.mock.patch.object(framework_runner, 'MAX_WAIT_TIME_SECONDS',
+                                   2))
 
     tool = self._minimal_initialization()
-    with self.assertRaises(Exception):
+    with self.assertRaisesRegex(Exception, 'Maximum wait time exceeded'):
       tool.execute()
 
+    self.sleep_mock.assert_has_calls(
+        [absltest.mock.call(1), absltest.mock.call(1.7)])
+
   def test_delete_cluster(self):
     tool = self._minimal_initialization()
     tool.execute()
 
-    self.build_mock.return_value.projects().locations().clusters(
-    ).delete.assert_called_with(
+    self.clusters_mock.delete.assert_called_with(
         name='projects/project/locations/zone/clusters/fsloadtest-d3d75-cluster'
     )
-    self.build_mock.return_value.projects().locations().clusters().delete(
-    ).execute.assert_called()
+    self.clusters_mock.delete.return_value.execute.assert_called()
 
   def test_delete_cluster_exception(self):
-    self.config_mock.load_kube_config.side_effect = Exception('ouch')
+    self.auth_mock.default.side_effect = Exception('ouch')
 
     tool = self._minimal_initialization()
     with self.assertRaises(Exception):
       tool.execute()
 
-    self.build_mock.return_value.projects().locations().clusters(
-    ).delete.assert_called_with(
+    self.clusters_mock.delete.assert_called_with(
         name='projects/project/locations/zone/clusters/fsloadtest-d3d75-cluster'
     )
-    self.build_mock.return_value.projects().locations().clusters().delete(
-    ).execute.assert_called()
+    self.clusters_mock.delete.return_value.execute.assert_called()
 
-  def test_wait_for_cluster_deletion(self):
-    self.build_mock.return_value.projects().locations().clusters().delete(
-    ).execute(
-    ).__getitem__.side_effect = lambda x: 'delete-operation' if x == 'name' else 'IN PROGRESS'
-    self.build_mock.return_value.projects().locations().operations().get(
-    ).execute().__getitem__.side_effect = ['IN PROGRESS', 'DONE']
-
-    tool = self._minimal_initialization()
+  def test_keep_cluster(self):
+    tool = self._minimal_initialization(_keep_cluster=True)
     tool.execute()
 
-    self.build_mock.return_value.projects().locations().operations(
-    ).get.assert_any_call(
-        name='projects/project/locations/zone/operations/delete-operation')
-    self.build_mock.return_value.projects().locations().operations().get(
-    ).execute().__getitem__.assert_called()
-    self.sleep_mock.assert_has_calls(
-        [absltest.mock.call(15), absltest.mock.call(15)])
+    self.clusters_mock.delete.assert_not_called()
 
-  def test_wait_for_cluster_deletion_timeout(self):
-    self.build_mock.return_value.projects().locations().clusters().delete(
-    ).execute(
-    ).__getitem__.side_effect = lambda x: 'delete-operation' if x == 'name' else 'IN PROGRESS'
-    self.build_mock.return_value.projects().locations().operations().get(
-    ).execute().__getitem__.return_value = 'IN PROGRESS'
+  def test_keep_named_cluster(self):
+    tool = self._minimal_initialization(_existing_cluster_name='my-cluster')
+    tool.execute()
 
-    tool = self._minimal_initialization()
-    with self.assertRaises(Exception):
-      tool.execute()
+    self.clusters_mock.delete.assert_not_called()
 
-  def test_keep_cluster(self):
-    tool = framework_runner.FrameworkRunner(
-        _project_id=self._DEFAULT_PROJ,
-        _region='region',
-        _target_qps=5,
-        _num_threads=2,
-        _sample_strategy='strategy',
-        _num_warmup_samples=5,
-        _num_samples=10,
-        _gcs_log_path='',
-        _cluster_zone='zone',
-        _cluster_size=5,
-        _existing_cluster_name='',
-        _keep_cluster=True,
-        _service_account='',
-        _feature_query_file_path='data/query_file.textproto',
-        _entity_file_path='data/entity_file.txt',
-        _image_url='image-url')
+  def test_load_credentials(self):
+    tool = self._minimal_initialization()
     tool.execute()
 
-    with self.assertRaises(AssertionError):
-      # Unfortunately assert_not_called doesn't work because there is a false positive call
-      self.build_mock.return_value.projects().locations().clusters(
-      ).delete.assert_called_with(
-          name='projects/project/locations/zone/clusters/fsloadtest-d3d75-cluster'
-      )
-
-  def test_keep_named_cluster(self):
-    tool = framework_runner.FrameworkRunner(
-        _project_id=self._DEFAULT_PROJ,
-        _region='region',
-        _target_qps=5,
-        _num_threads=2,
-        _sample_strategy='strategy',
-        _num_warmup_samples=5,
-        _num_samples=10,
-        _gcs_log_path='',
-        _cluster_zone='zone',
-        _cluster_size=5,
-        _existing_cluster_name='my-cluster',
-        _keep_cluster=False,
-        _service_account='',
-        _feature_query_file_path='data/query_file.textproto',
-        _entity_file_path='data/entity_file.txt',
-        _image_url='image-url')
+    self.clusters_mock.get.assert_called_with(
+        name='projects/project/locations/zone/clusters/fsloadtest-d3d75-cluster'
+    )
+    self.auth_mock.default.assert_called_once_with(
+        scopes=['https://www.googleapis.com/auth/cloud-platform'])
+    self.credentials_mock.refresh.assert_called_with(
+        self.request_mock.return_value)
+    self.client_mock.Configuration.assert_called_once_with(
+        host='https://127.0.0.1',
+        api_key={'BearerToken': 'token'},
+        api_key_prefix={'BearerToken': 'Bearer'},
+        ca_cert_data='ca-cert')
+    self.client_mock.Configuration.set_default.assert_called_once_with(
+        self.client_mock.Configuration.return_value)
+
+  def test_load_credentials_custom_cluster(self):
+    tool = self._minimal_initialization(_existing_cluster_name='cluster')
     tool.execute()
 
-    with self.assertRaises(AssertionError):
-      # Unfortunately assert_not_called doesn't work because there is a false positive call
-      self.build_mock.return_value.projects().locations().clusters(
-      ).delete.assert_called_with(
-          name='projects/project/locations/zone/clusters/my-cluster')
+    self.clusters_mock.get.assert_called_with(
+        name='projects/project/locations/zone/clusters/cluster')
+    self.client_mock.Configuration.set_default.assert_called_once_with(
+        self.client_mock.Configuration.return_value)
 
-  def test_run_gcloud_get_credentials(self):
+  def test_load_credentials_refresh_token(self):
     tool = self._minimal_initialization()
     tool.execute()
 
-    self.subprocess_mock.run.assert_called_with([
-        'gcloud', 'container', 'clusters', 'get-credentials',
-        'fsloadtest-d3d75-cluster', f'--project={self._DEFAULT_PROJ}',
-        '--zone=zone'
-    ],
-                                                check=True)
-    self.config_mock.load_kube_config.assert_called_once()
-
-  def test_run_gcloud_get_credentials_custom_cluster(self):
-    tool = framework_runner.FrameworkRunner(
-        _project_id=self._DEFAULT_PROJ,
-        _region='region',
-        _target_qps=5,
-        _num_threads=2,
-        _sample_strategy='strategy',
-        _num_warmup_samples=5,
-        _num_samples=10,
-        _gcs_log_path='',
-        _cluster_zone='zone',
-        _cluster_size=5,
-        _existing_cluster_name='cluster',
-        _keep_cluster=False,
-        _service_account='',
-        _feature_query_file_path='data/query_file.textproto',
-        _entity_file_path='data/entity_file.txt',
-        _image_url='image-url')
-    tool.execute()
+    refresh_token = self.client_mock.Configuration.return_value.refresh_api_key_hook
+    configuration = SimpleNamespace(api_key={'BearerToken': 'token'})
+    self.credentials_mock.valid = False
+    self.credentials_mock.token = 'new-token'
+    refresh_token(configuration)
 
-    self.subprocess_mock.run.assert_called_with([
-        'gcloud', 'container', 'clusters', 'get-credentials', 'cluster',
-        f'--project={self._DEFAULT_PROJ}', '--zone=zone'
-    ],
-                                                check=True)
-    self.config_mock.load_kube_config.assert_called_once()
+    self.assertEqual({'BearerToken': 'new-token'}, configuration.api_key)
 
   def test_write_job_file_include_entity_file_arguments(self):
-    self.open_mock.return_value.__enter__().readline.side_effect = [
-        '<<job_name>> <<pods>> '
+    self.open_mock.return_value.__enter__().read.return_value = (
+        '<<job_name>> <<run_name>> <<pods>> '
         '<<image_url>> <<args>> <<project_id>> '
-        '<<feature_query_file_path>> <<feature_query_file_content>> '
-        '<<entity_file_path>> <<entity_file_content>>', ''
-    ]
+        '<<feature_query_file_path>> <<entity_file_path>>')
 
-    tool = framework_runner.FrameworkRunner(
-        _project_id='project',
-        _region='region',
-        _target_qps=5,
-        _num_threads=2,
-        _sample_strategy='strategy',
-        _num_warmup_samples=5,
-        _num_samples=10,
+    tool = self._minimal_initialization(
         _gcs_log_path='log-file-path',
-        _cluster_zone='zone',
-        _cluster_size=5,
-        _existing_cluster_name='',
-        _keep_cluster=False,
-        _service_account='',
-        _feature_query_file_path='data/query_file.textproto',
-        _entity_file_path='gs://bucket/data/entity_file.txt',
-        _image_url='image-url')
+        _entity_file_path='gs://bucket/data/entity_file.txt')
     tool.execute()
 
     self.open_mock.assert_called_with('data/job_template.yaml', 'r')
-    self.open_mock.return_value.__enter__().readline.assert_called()
+    self.open_mock.return_value.__enter__().read.assert_called()
     self.open_mock.return_value.__exit__.assert_called()
 
-    self.fdopen_mock.assert_called_with(0, 'w')
-    self.fdopen_mock.return_value.__enter__().write.assert_called()
-    self.fdopen_mock.return_value.__enter__().flush.assert_called()
-    self.fdopen_mock.return_value.__exit__.assert_called()
+    self.utils_mock.create_from_yaml.assert_called()
     self.assertEqual(
-        'fsloadtest-d3d75-job 5 image-url --target_qps=1 '
+        'fsloadtest-d3d75-job fsloadtest-d3d75 5 image-url '
+        '--target_qps=1 '
         '--num_threads=2 --sample_strategy=strategy '
         '--num_samples=10 --project_id=project '
         '--region=region --gcs_output_path=log-file-path '
         '--feature_query_file=/config/data/query_file.textproto '
         '--entity_file=gs://bucket/data/entity_file.txt --num_warmup_samples=5 '
         '--bigquery_output_dataset=project.vertex_ai_benchmarker_results_5_qps_d3d75 project '
-        'data/query_file.textproto '
-        'IyBwcm90by1maWxlOiBmZWF0dXJlc3RvcmVfb25saW5lX3NlcnZpY2UucHJvdG8KIyBwcm90by1tZXNzYWdlOiBSZXF1ZXN0cwoKcmVxdWVzdHNfcGVyX2ZlYXR1cmVzdG9yZTogewogIGZlYXR1cmVzdG9yZV9pZDogImJlbmNobWFya19mZWF0dXJlc3RvcmVfYWJjMTIzIgogIHJlcXVlc3RzOiB7CiAgICByZWFkX2ZlYXR1cmVfdmFsdWVzX3JlcXVlc3Q6IHsKICAgICAgZW50aXR5X3R5cGU6ICJodW1hbiIKICAgICAgZW50aXR5X2lkOiAiJHtFTlRJVFlfSUR9IgogICAgICBmZWF0dXJlX3NlbGVjdG9yOiB7CiAgICAgICAgaWRfbWF0Y2hlcjogewogICAgICAgICAgaWRzOiBbIioiXQogICAgICAgIH0KICAgICAgfQogICAgfQogIH0KfQo= '
-        'example_entity_file.txt '
-        'ZmVhdHVyZXN0b3Jlcy9iZW5jaG1hcmtfZmVhdHVyZXN0b3JlX2FiYzEyMy9lbnRpdHlUeXBlcy9odW1hbi9lbnRpdHkvdXNlcl9hQGdtYWlsLmNvbQpmZWF0dXJlc3RvcmVzL2JlbmNobWFya19mZWF0dXJlc3RvcmVfYWJjMTIzL2VudGl0eVR5cGVzL2h1bWFuL2VudGl0eS91c2VyX2JAZ21haWwuY29tCmZlYXR1cmVzdG9yZXMvYmVuY2htYXJrX2ZlYXR1cmVzdG9yZV9hYmMxMjMvZW50aXR5VHlwZXMvaHVtYW4vZW50aXR5L3VzZXJfY0BnbWFpbC5jb20K',
-        self.fdopen_text)
+        'data/query_file.textproto example_entity_file.txt',
+        *self.utils_mock.create_from_yaml.call_args.kwargs['yaml_objects'])
+
+  def test_create_config_map(self):
+    tool = self._minimal_initialization(
+        _target_qps=7, _entity_file_path='gs://bucket/data/entity_file.txt')
+    tool.execute()
+
+    self.client_mock.V1ObjectMeta.assert_called_once_with(
+        name='fsloadtest-d3d75-config-files')
+    self.client_mock.V1ConfigMap.assert_called_once_with(
+        metadata=self.client_mock.V1ObjectMeta.return_value,
+        binary_data={
+            'feature_query_file': _QUERY_FILE_BASE64,
+            'entity_file': _ENTITY_FILE_BASE64,
+        })
+    # A single ConfigMap is shared by both jobs
+    self.client_mock.CoreV1Api.return_value.create_namespaced_config_map.assert_called_once_with(
+        'default', self.client_mock.V1ConfigMap.return_value)
+
+  def test_base64_content_in_chunks(self):
+    self.enter_context(
+        absltest.mock.patch.object(framework_runner, 'BASE64_READ_CHUNK_SIZE',
+                                   3))
+
+    self.assertEqual(_ENTITY_FILE_BASE64,
+                     framework_runner._base64_content('data/entity_file.txt'))
 
   def test_write_multiple_job_files(self):
-    self.open_mock.return_value.__enter__().readline.side_effect = [
-        '<<job_name>> <<pods>> '
-        '<<image_url>> <<args>> <<project_id>>', '',
-        '<<job_name>> <<pods>> <<image_url>> <<args>> <<project_id>>', ''
-    ]
+    self.open_mock.return_value.__enter__().read.return_value = (
+        '<<job_name>> <<pods>> <<image_url>> <<args>> <<project_id>>')
 
-    tool = framework_runner.FrameworkRunner(
-        _project_id='project',
-        _region='region',
-        _target_qps=7,
-        _num_threads=2,
-        _sample_strategy='strategy',
-        _num_warmup_samples=5,
-        _num_samples=10,
-        _gcs_log_path='log-file-path',
-        _cluster_zone='zone',
-        _cluster_size=5,
-        _existing_cluster_name='',
-        _keep_cluster=False,
-        _service_account='',
-        _feature_query_file_path='data/query_file.textproto',
-        _entity_file_path='data/entity_file.txt',
-        _image_url='image-url')
+    tool = self._minimal_initialization(
+        _target_qps=7, _gcs_log_path='log-file-path')
     tool.execute()
 
-    self.open_mock.assert_called_with('data/job_template.yaml', 'r')
-    self.open_mock.return_value.__enter__().readline.assert_called()
+    # The template is read and filled out with the run wide flags only once
+    self.open_mock.assert_called_once_with('data/job_template.yaml', 'r')
+    self.open_mock.return_value.__enter__().read.assert_called()
     self.open_mock.return_value.__exit__.assert_called()
 
-    self.fdopen_mock.assert_called_with(0, 'w')
-    self.fdopen_mock.return_value.__enter__().write.assert_called()
-    self.fdopen_mock.return_value.__enter__().flush.assert_called()
-    self.fdopen_mock.return_value.__exit__.assert_called()
-    self.assertEqual(
+    self.utils_mock.create_from_yaml.assert_called()
+    # The jobs are created concurrently, so they may be written in any order
+    self.assertCountEqual([
         'fsloadtest-d3d75-job 4 image-url --target_qps=1 '
         '--num_threads=2 --sample_strategy=strategy '
         '--num_samples=10 --project_id=project --region=region '
@@ -495,7 +428,8 @@ class FrameworkRunnerTest(absltest.TestCase):
         '--entity_file=/config/data/entity_file.txt '
         '--num_warmup_samples=5 '
         '--bigquery_output_dataset=project.vertex_ai_benchmarker_results_7_qps_d3d75 '
-        'projectfsloadtest-d3d75-job 1 image-url --target_qps=3 '
+        'project',
+        'fsloadtest-d3d75-job 1 image-url --target_qps=3 '
         '--num_threads=2 --sample_strategy=strategy '
         '--num_samples=10 --project_id=project --region=region '
         '--gcs_output_path=log-file-path '
@@ -504,62 +438,180 @@ class FrameworkRunnerTest(absltest.TestCase):
         '--num_warmup_samples=5 '
         '--bigquery_output_dataset=project.vertex_ai_benchmarker_results_7_qps_d3d75 '
         'project',
-        self.fdopen_text,
-    )
+    ], [
+        yaml_object for call in self.utils_mock.create_from_yaml.call_args_list
+        for yaml_object in call.kwargs['yaml_objects']
+    ])
 
   def test_create_job_from_yaml(self):
+    self.open_mock.return_value.__enter__().read.return_value = (
+        'kind: Job\n'
+        'metadata:\n'
+        '  name: <<job_name>>\n'
+        '---\n'
+        'kind: Other\n')
+
     tool = self._minimal_initialization()
     tool.execute()
 
-    self.utils_mock.create_from_yaml.assert_called_with(
-        self.client_mock.ApiClient.return_value, '/temp')
+    self.utils_mock.create_from_yaml.assert_called_once_with(
+        self.client_mock.ApiClient.return_value,
+        yaml_objects=[{
+            'kind': 'Job',
+            'metadata': {
+                'name': 'fsloadtest-d3d75-job'
+            }
+        }, {
+            'kind': 'Other'
+        }])
+
+  def test_wait_for_job_to_complete(self):
+    job_status_wait = SimpleNamespace(
+        metadata=SimpleNamespace(
+            name='fsloadtest-d3d75-job', resource_version='1'),
+        status=SimpleNamespace(succeeded=None, failed=None))
+    job_status_succeeded = SimpleNamespace(
+        metadata=SimpleNamespace(
+            name='fsloadtest-d3d75-job', resource_version='2'),
+        status=SimpleNamespace(succeeded=True, failed=False))
+    self.watch_mock.Watch.return_value.stream.side_effect = lambda *args, **kwargs: iter(
+        [{
+            'object': job_status_wait
+        }, {
+            'object': job_status_succeeded
+        }])
 
-  def test_delete_temp_file(self):
     tool = self._minimal_initialization()
     tool.execute()
 
-    self.remove_mock.assert_called_with('/temp')
+    self.watch_mock.Watch.return_value.stream.assert_called_once_with(
+        self.batch_api_mock.list_namespaced_job,
+        namespace='default',
+        label_selector='fsloadtest-run=fsloadtest-d3d75',
+        resource_version=None,
+        timeout_seconds=1800)
+    self.watch_mock.Watch.return_value.stop.assert_called_once()
+    self.sleep_mock.assert_not_called()
+
+  def test_wait_for_multiple_jobs_to_complete(self):
+    self.uuid_mock.side_effect = [
+        'dataset0', 'cluster0', 'run00', 'job00', 'job01'
+    ]
+    job_status_primary = SimpleNamespace(
+        metadata=SimpleNamespace(
+            name='fsloadtest-job00-job', resource_version='1'),
+        status=SimpleNamespace(succeeded=True, failed=None))
+    job_status_secondary = SimpleNamespace(
+        metadata=SimpleNamespace(
+            name='fsloadtest-job01-job', resource_version='2'),
+        status=SimpleNamespace(succeeded=True, failed=None))
+    self.watch_mock.Watch.return_value.stream.side_effect = lambda *args, **kwargs: iter(
+        [{
+            'object': job_status_primary
+        }, {
+            'object': job_status_primary
+        }, {
+            'object': job_status_secondary
+        }])
+
+    tool = self._minimal_initialization(_target_qps=7)
+    tool.execute()
 
-  def test_delete_temp_file_exception(self):
-    self.utils_mock.create_from_yaml.side_effect = Exception('ouch')
+    # Both jobs are followed by a single watch
+    self.watch_mock.Watch.return_value.stream.assert_called_once_with(
+        self.batch_api_mock.list_namespaced_job,
+        namespace='default',
+        label_selector='fsloadtest-run=fsloadtest-run00',
+        resource_version=None,
+        timeout_seconds=1800)
+    self.watch_mock.Watch.return_value.stop.assert_called_once()
+
+  def test_wait_for_job_after_watch_ends(self):
+    job_status_wait = SimpleNamespace(
+        metadata=SimpleNamespace(
+            name='fsloadtest-d3d75-job', resource_version='1'),
+        status=SimpleNamespace(succeeded=None, failed=None))
+    job_status_succeeded = SimpleNamespace(
+        metadata=SimpleNamespace(
+            name='fsloadtest-d3d75-job', resource_version='2'),
+        status=SimpleNamespace(succeeded=True, failed=False))
+    # The first connection is closed before the job completes
+    self.watch_mock.Watch.return_value.stream.side_effect = [
+        iter([{
+            'object': job_status_wait
+        }]),
+        iter([{
+            'object': job_status_succeeded
+        }])
+    ]
+    self.monotonic_mock.side_effect = [0, 0, 60]
 
     tool = self._minimal_initialization()
-    with self.assertRaises(Exception):
-      tool.execute()
-
-    self.remove_mock.assert_called_with('/temp')
+    tool.execute()
 
-  def test_wait_for_job_to_complete(self):
-    job_status_wait = absltest.mock.MagicMock()
-    job_status_wait.status.succeeded = None
-    job_status_wait.status.failed = None
-    job_status_succeeded = absltest.mock.MagicMock()
-    job_status_succeeded.status.succeeded = True
-    job_status_succeeded.status.failed = False
-    self.client_mock.BatchV1Api.return_value.read_namespaced_job_status.side_effect = [
-        job_status_wait, job_status_succeeded
+    stream_mock = self.watch_mock.Watch.return_value.stream
+    self.assertEqual(stream_mock.call_count, 2)
+    # The second watch resumes where the first one left off
+    self.assertEqual(stream_mock.call_args.kwargs['resource_version'], '1')
+    self.assertEqual(stream_mock.call_args.kwargs['timeout_seconds'], 1740)
+    self.watch_mock.Watch.return_value.stop.assert_called_once()
+
+  def test_wait_for_job_after_watch_expires(self):
+    job_status_wait = SimpleNamespace(
+        metadata=SimpleNamespace(
+            name='fsloadtest-d3d75-job', resource_version='1'),
+        status=SimpleNamespace(succeeded=None, failed=None))
+    job_status_succeeded = SimpleNamespace(
+        metadata=SimpleNamespace(
+            name='fsloadtest-d3d75-job', resource_version='2'),
+        status=SimpleNamespace(succeeded=True, failed=False))
+
+    def expired_stream():
+      yield {'object': job_status_wait}
+      raise ApiException(status=410, reason='Expired')
+
+    self.watch_mock.Watch.return_value.stream.side_effect = [
+        expired_stream(),
+        iter([{
+            'object': job_status_succeeded
+        }])
     ]
 
     tool = self._minimal_initialization()
     tool.execute()
 
-    self.client_mock.BatchV1Api().read_namespaced_job_status.assert_called_with(
-        'fsloadtest-d3d75-job', 'default')
-    self.sleep_mock.assert_called_once()
+    stream_mock = self.watch_mock.Watch.return_value.stream
+    self.assertEqual(stream_mock.call_count, 2)
+    # The expired version can't be resumed from, so the jobs are listed afresh
+    self.assertIsNone(stream_mock.call_args.kwargs['resource_version'])
+    self.watch_mock.Watch.return_value.stop.assert_called_once()
+
+  def test_wait_for_job_watch_error(self):
+    self.watch_mock.Watch.return_value.stream.side_effect = ApiException(
+        status=403, reason='Forbidden')
+
+    tool = self._minimal_initialization()
+    with self.assertRaises(ApiException):
+      tool.execute()
 
   def test_wait_for_job_to_timeout(self):
-    job_status_wait = absltest.mock.MagicMock()
-    job_status_wait.status.succeeded = None
-    job_status_wait.status.failed = None
-    job_status_succeeded = absltest.mock.MagicMock()
-    job_status_succeeded.status.succeeded = True
-    job_status_succeeded.status.failed = False
-    self.client_mock.BatchV1Api.return_value.read_namespaced_job_status.return_value = job_status_wait
+    job_status_wait = SimpleNamespace(
+        metadata=SimpleNamespace(
+            name='fsloadtest-d3d75-job', resource_version='1'),
+        status=SimpleNamespace(succeeded=None, failed=None))
+    self.watch_mock.Watch.return_value.stream.side_effect = lambda *args, **kwargs: iter(
+        [{
+            'object': job_status_wait
+        }])
+    self.monotonic_mock.side_effect = [0, 0, 900, 1800]
 
     tool = self._minimal_initialization()
-    with self.assertRaises(Exception):
+    with self.assertRaisesRegex(Exception, 'Maximum wait time exceeded'):
       tool.execute()
 
+    self.assertEqual(
+        self.watch_mock.Watch.return_value.stream.call_count, 2)
+
 
 if __name__ == '__main__':
   absltest.main()
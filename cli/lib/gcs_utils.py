@@ -0,0 +1,35 @@
+# Copyright 2022 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+GS_PATH_PREFIX = 'gs://'
+
+
+def split_gcs_path(gcs_path: str) -> tuple[str, str]:
+  """Split a GCS path into its bucket and blob names.
+
+    Args:
+        gcs_path: Path such as gs://bucket/path/to/blob.
+
+    Returns:
+        Name of the bucket.
+        Name of the blob (may be empty).
+
+    Raises:
+        ValueError if the path isn't a GCS path with a bucket.
+  """
+  bucket_name, _, blob_name = gcs_path.removeprefix(GS_PATH_PREFIX).partition(
+      '/')
+  if not gcs_path.startswith(GS_PATH_PREFIX) or not bucket_name:
+    raise ValueError(f'Not a valid GS path format: {gcs_path}')
+  return bucket_name, blob_name